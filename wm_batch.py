@@ -0,0 +1,502 @@
+"""命令行批处理：不导入 tkinter，可在无显示环境下批量给图片加水印
+
+    python watermark.py batch 照片目录 "more/*.jpg" -o 输出目录 --text "© YourName"
+    python watermark.py batch 照片目录 -o 输出目录 --image logo.png --scale 0.5 --x 200 --y 120
+    python watermark.py batch 照片目录 -o 输出目录 -j 8 --max-megapixels 400
+    python watermark.py batch 照片目录 -o 输出目录 --text "{stem} · {mtime:%Y-%m-%d}" --font msyh
+    python watermark.py batch 照片目录 -o 输出目录 --job 任务.json   # 或 --preset 预设名
+"""
+import argparse
+import collections
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+
+from PIL import Image, ImageColor
+
+from wm_core import (
+    ENCODER_PROFILES,
+    Layer,
+    apply_layers,
+    apply_orientation,
+    exif_orientation,
+    load_watermark_image,
+    output_formats,
+    save_image,
+)
+from wm_fonts import TextSpec, render_spec, resolve_font, text_context
+from wm_job import job_layers, job_params, job_watermarks, load_job, load_preset
+from wm_manifest import Manifest, file_settings, manifest_key, settings_hash
+from wm_profile import recording, stage
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+
+# ---------- 输入收集 ----------
+def iter_input_files(inputs, recursive=False):
+    """展开 文件 / 目录 / 通配符，产出 (源路径, 相对输出路径)，同一文件只出现一次"""
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            if recursive:
+                for dirpath, dirnames, filenames in os.walk(item):
+                    dirnames.sort()
+                    found.extend(os.path.join(dirpath, f) for f in sorted(filenames))
+            else:
+                found = [os.path.join(item, f) for f in sorted(os.listdir(item))]
+            pairs = [
+                (p, os.path.relpath(p, item))
+                for p in found
+                if p.lower().endswith(IMAGE_EXTS)
+            ]
+        elif glob.has_magic(item):
+            root = glob_root(item)
+            pairs = [
+                (p, os.path.relpath(p, root))
+                for p in sorted(glob.glob(item, recursive=recursive))
+                if p.lower().endswith(IMAGE_EXTS)
+            ]
+        else:
+            # 明确给出的文件不按扩展名过滤
+            pairs = [(item, os.path.basename(item))]
+        for path, rel in pairs:
+            key = os.path.normcase(os.path.abspath(path))
+            if key in seen or not os.path.isfile(path):
+                continue
+            seen.add(key)
+            yield path, rel
+
+
+def glob_root(pattern):
+    """通配符中不含通配符的开头部分（目录），匹配结果相对它保留子目录"""
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or os.curdir
+
+
+def output_path(rel, out_dir, fmt=None):
+    if fmt:
+        rel = os.path.splitext(rel)[0] + "." + fmt
+    return os.path.join(out_dir, rel)
+
+
+# ---------- 单张处理 ----------
+def build_watermark(args):
+    """根据命令行参数生成水印：图片水印为基础图 (RGBA)，文字水印为 TextSpec
+
+    文字到真正处理图片时才渲染（resolve_watermark），清单全部跳过时不加载
+    FreeType；清单按 TextSpec 而不是位图计算设置哈希。
+    """
+    if args.image:
+        return load_watermark_image(args.image)
+    fill = ImageColor.getrgb(args.color)
+    if len(fill) == 3:
+        fill += (255,)
+    # 在主进程里解析成字体文件路径，工作进程不必再扫描字体目录
+    return TextSpec(args.text, max(8, args.font_size), fill, resolve_font(args.font))
+
+
+def resolve_watermark(wm_base, src, index, size, on_disk=True):
+    """TextSpec 按图片展开成水印基础图；展开结果相同的图片共用缓存的位图"""
+    if not isinstance(wm_base, TextSpec):
+        return wm_base
+    return render_spec(wm_base, text_context(src, index, size, on_disk))
+
+
+def image_params(params, base_size, wm_size):
+    """任务描述（含 anchor）按底图尺寸换算成像素参数，像素参数原样返回"""
+    if "anchor" in params:
+        return job_params(params, base_size, wm_size)
+    return params
+
+
+def image_layers(wm_base, params, src, index, base_size, on_disk=True):
+    """一张图片上的图层列表（wm_core.Layer）
+
+    wm_base 为单个水印时 params 是它的参数；为列表（任务的各层水印）时
+    params 是 wm_job 的任务描述，按层一一对应。src 不是本机文件时
+    on_disk=False（见 wm_fonts.text_context）。
+    """
+    if isinstance(wm_base, list):
+        pairs = zip(wm_base, job_layers(params))
+    else:
+        pairs = [(wm_base, params)]
+    layers = []
+    for base, layer_params in pairs:
+        base = resolve_watermark(base, src, index, base_size, on_disk)
+        layers.append(Layer(base, **image_params(layer_params, base_size, base.size)))
+    return layers
+
+
+def watermark_file(src, dst, wm_base, params, save_options=None, index=1):
+    """读取 src，合成水印后写到 dst
+
+    params 为像素参数 center/scale/rotation/opacity/tile，或 wm_job 的任务描述
+    （此时 wm_base 为各层水印的列表，见 image_layers）；save_options 为
+    save_image 的 profile/quality 等参数。多层水印只解码、编码一次。
+    """
+    out_dir = os.path.dirname(dst)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with Image.open(src) as im:
+        with stage("解码") as st:
+            im.load()
+            st.note(im)
+        orientation = exif_orientation(im)
+        upright = apply_orientation(im, orientation)
+        with stage("文字水印"):
+            layers = image_layers(wm_base, params, src, index, upright.size)
+        # 刚解码的图片归本函数所有，直接原地合成
+        result = apply_layers(upright, layers, inplace=True)
+        save_image(result, dst, **(save_options or {}))
+
+
+# ---------- 并行批处理 ----------
+# stages：开启计时时各阶段的记录（wm_profile.Recorder.stages），否则为 None
+TaskResult = collections.namedtuple(
+    "TaskResult", "pid src dst seconds megapixels error stages", defaults=(None,)
+)
+
+# 每个进程只接收一次的水印参数（ProcessPoolExecutor initializer 设置）
+_worker_state = {}
+
+
+def init_worker(wm_base, params, save_options, record=False):
+    """进程池 initializer：保存本进程的水印参数，供 run_task 使用"""
+    _worker_state["wm_base"] = wm_base
+    _worker_state["params"] = params
+    _worker_state["save_options"] = save_options
+    _worker_state["record"] = record
+
+
+def run_task(src, dst, index=1):
+    """按 init_worker 设置的参数处理一张图片，返回 TaskResult（错误记在 error 中）"""
+    start = time.perf_counter()
+    megapixels = 0.0
+    record = _worker_state.get("record")
+    with recording() if record else contextlib.nullcontext() as recorder:
+        try:
+            with Image.open(src) as im:
+                megapixels = im.width * im.height / 1e6
+            watermark_file(
+                src,
+                dst,
+                _worker_state["wm_base"],
+                _worker_state["params"],
+                _worker_state["save_options"],
+                index,
+            )
+            error = None
+        except Exception as e:
+            error = str(e)
+    seconds = time.perf_counter() - start
+    stages = recorder.stages if recorder is not None else None
+    return TaskResult(os.getpid(), src, dst, seconds, megapixels, error, stages)
+
+
+def image_megapixels(path):
+    # 只读文件头，不解码像素
+    try:
+        with Image.open(path) as im:
+            return im.width * im.height / 1e6
+    except Exception:
+        return 0.0
+
+
+def run_batch(
+    tasks,
+    wm_base,
+    params,
+    save_options=None,
+    workers=1,
+    max_inflight=None,
+    max_megapixels=None,
+    record=False,
+):
+    """处理 (src, dst) 或 (src, dst, index) 列表，按完成顺序产出 TaskResult
+
+    wm_base 可以是 TextSpec，此时每张图片按自己的文件名/序号展开文字；
+    也可以是任务各层水印的列表（见 image_layers）；
+    未给出 index 时按列表中的位置（从 1 起）编号。
+
+    workers > 1 时使用进程池；水印参数通过 initializer 每个进程只传一次。
+    同时在途（已提交未完成）的任务数不超过 max_inflight，其像素总量不超过
+    max_megapixels（单张超限时仍单独放行），以限制同时解码的大图占用内存。
+    record=True 时每个 TaskResult 带有各阶段的耗时与中间图像尺寸。
+    """
+    todo = collections.deque(
+        (task[0], task[1], task[2] if len(task) > 2 else i) for i, task in enumerate(tasks, 1)
+    )
+    if workers <= 1:
+        init_worker(wm_base, params, save_options, record)
+        for src, dst, index in todo:
+            yield run_task(src, dst, index)
+        return
+
+    # 进程池（multiprocessing）只在并行时导入，单进程调用省去这部分启动时间
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    max_inflight = max(1, max_inflight or workers * 2)
+    pending = {}
+    inflight_mp = 0.0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(wm_base, params, save_options, record),
+    ) as pool:
+        while todo or pending:
+            while todo and len(pending) < max_inflight:
+                mp = image_megapixels(todo[0][0]) if max_megapixels else 0.0
+                if pending and max_megapixels and inflight_mp + mp > max_megapixels:
+                    break
+                src, dst, index = todo.popleft()
+                pending[pool.submit(run_task, src, dst, index)] = mp
+                inflight_mp += mp
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                inflight_mp -= pending.pop(future)
+                yield future.result()
+
+
+def format_worker_stats(results, wall_seconds):
+    """按进程汇总吞吐量，用于评估机器配置"""
+    per_pid = collections.OrderedDict()
+    for r in results:
+        stat = per_pid.setdefault(r.pid, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += r.megapixels
+        stat[2] += r.seconds
+    lines = [f"{'pid':>8} {'files':>6} {'MP':>9} {'busy(s)':>8} {'img/s':>7} {'MP/s':>7}"]
+    total_files, total_mp = 0, 0.0
+    for pid, (files, mp, busy) in per_pid.items():
+        total_files += files
+        total_mp += mp
+        rate = files / busy if busy else 0.0
+        mp_rate = mp / busy if busy else 0.0
+        lines.append(
+            f"{pid:>8} {files:>6} {mp:>9.1f} {busy:>8.2f} {rate:>7.2f} {mp_rate:>7.1f}"
+        )
+    if wall_seconds > 0:
+        lines.append(
+            f"{'total':>8} {total_files:>6} {total_mp:>9.1f} {wall_seconds:>8.2f} "
+            f"{total_files / wall_seconds:>7.2f} {total_mp / wall_seconds:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def open_timings(path):
+    if path is None:
+        return None
+    if path == "-":
+        return sys.stdout
+    return open(path, "a", encoding="utf-8")
+
+
+def write_timing(f, result):
+    """每张图片一行 JSON：文件、进程、总耗时与各阶段记录"""
+    record = {
+        "src": result.src,
+        "dst": result.dst,
+        "pid": result.pid,
+        "ms": round(result.seconds * 1000.0, 2),
+        "megapixels": round(result.megapixels, 2),
+        "error": result.error,
+        "stages": result.stages,
+    }
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+
+
+# ---------- 命令行 ----------
+def add_watermark_args(parser):
+    """水印与编码参数（batch 与 watch 共用）"""
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument(
+        "--text",
+        default="© YourName",
+        help="文字水印内容，可用 {filename} {stem} {ext} {index} {date} {mtime:%%Y-%%m-%%d} {width} {height}",
+    )
+    src.add_argument("--image", help="图片水印文件（PNG 推荐）")
+    src.add_argument("--job", help="任务 JSON（界面“导出任务”生成），忽略其它水印参数")
+    src.add_argument("--preset", help="已保存的预设名（~/.watermark_pro/presets）")
+    parser.add_argument("--font-size", type=int, default=72, help="字体大小（基准）")
+    parser.add_argument("--font", help="字体名（如 msyh、simhei）或字体文件路径")
+    parser.add_argument("--color", default="white", help="文字颜色，如 white、#ff0000")
+    parser.add_argument("--scale", type=float, default=1.0, help="缩放 (wm_user_scale)")
+    parser.add_argument("--rotation", type=float, default=0.0, help="旋转角度（度）")
+    parser.add_argument("--opacity", type=float, default=0.6, help="透明度 0.0 - 1.0")
+    parser.add_argument("--x", type=int, help="水印中心 x（原图像素，默认居中）")
+    parser.add_argument("--y", type=int, help="水印中心 y（原图像素，默认居中）")
+    parser.add_argument("--tile", action="store_true", help="平铺水印（以 --x/--y 为格点原点铺满整图）")
+    parser.add_argument("--tile-spacing", type=float, default=0.5, help="平铺间距，相对水印尺寸")
+    parser.add_argument("--tile-stagger", type=float, default=0.5, help="相邻行错开比例 0.0 - 1.0")
+    parser.add_argument("--tile-angle", type=float, help="平铺行方向角度（默认跟随 --rotation）")
+    parser.add_argument("--format", choices=output_formats(), help="输出格式（默认与原图一致）")
+    parser.add_argument(
+        "--profile",
+        choices=list(ENCODER_PROFILES),
+        default="default",
+        help="编码配置：fast 编码快，small 文件小（默认 default）",
+    )
+    parser.add_argument("--quality", type=int, help="JPEG/WebP/AVIF 质量（覆盖编码配置）")
+
+
+def watermark_from_args(args):
+    """由命令行参数得到 (wm_base, params)；使用任务/预设时 wm_base 为各层水印的列表"""
+    job = None
+    if args.job:
+        job = load_job(args.job)
+    elif args.preset:
+        job = load_preset(args.preset)
+    if job is not None:
+        return job_watermarks(job), job
+    wm_base = build_watermark(args)
+    params = {
+        "center": None if args.x is None else (args.x, args.y),
+        "scale": args.scale,
+        "rotation": args.rotation,
+        "opacity": max(0.0, min(1.0, args.opacity)),
+        "tile": None,
+    }
+    if args.tile:
+        params["tile"] = {
+            "spacing": max(0.0, args.tile_spacing),
+            "stagger": args.tile_stagger,
+            "angle": args.tile_angle,
+        }
+    return wm_base, params
+
+
+def save_options_from_args(args):
+    return {"profile": args.profile, "quality": args.quality}
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="watermark.py batch", description="批量给图片添加文字/图片水印（无界面）"
+    )
+    parser.add_argument("inputs", nargs="+", help="图片文件、目录或通配符（如 'photos/*.jpg'）")
+    parser.add_argument("-o", "--output", required=True, help="输出目录")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    add_watermark_args(parser)
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="并行进程数（0 表示 CPU 核数）"
+    )
+    parser.add_argument(
+        "--max-inflight", type=int, help="同时在途的最大任务数（默认 2×进程数）"
+    )
+    parser.add_argument(
+        "--max-megapixels", type=float, help="同时在途图片的像素总量上限（百万像素）"
+    )
+    parser.add_argument("--stats", action="store_true", help="结束时输出每个进程的吞吐量")
+    parser.add_argument(
+        "--force", action="store_true", help="忽略输出目录中的清单，全部重新生成"
+    )
+    parser.add_argument(
+        "--timings", metavar="FILE", help="把每张图片各阶段的耗时写入 JSON Lines 文件（- 表示标准输出）"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if (args.x is None) != (args.y is None):
+        print("错误：--x 与 --y 需同时指定", file=sys.stderr)
+        return 2
+    files = list(iter_input_files(args.inputs, args.recursive))
+    if not files:
+        print("没有找到可处理的图片", file=sys.stderr)
+        return 1
+    try:
+        wm_base, params = watermark_from_args(args)
+    except Exception as e:
+        print(f"生成水印失败：{e}", file=sys.stderr)
+        return 1
+
+    save_options = save_options_from_args(args)
+    settings = settings_hash(wm_base, params, save_options, args.format)
+    manifest = Manifest.for_output(args.output)
+    failed = skipped = 0
+    tasks = []
+    pending = {}  # src -> (清单键, 单张设置哈希, 处理前的 stat)
+    targets = {}  # 输出路径 -> 第一个写到这里的输入
+    for index, (src, rel) in enumerate(files, 1):
+        dst = output_path(rel, args.output, args.format)
+        if os.path.abspath(dst) == os.path.abspath(src):
+            print(f"跳过 {src}：输出会覆盖原图", file=sys.stderr)
+            failed += 1
+            continue
+        # 不同目录下的同名文件（或 --format 统一扩展名后）会写到同一个输出
+        target = os.path.normcase(os.path.abspath(dst))
+        if target in targets:
+            print(f"跳过 {src}：输出 {dst} 与 {targets[target]} 相同", file=sys.stderr)
+            failed += 1
+            continue
+        targets[target] = src
+        key = manifest_key(dst, args.output)
+        try:
+            st = os.stat(src)
+            file_key = file_settings(settings, wm_base, src, index)
+        except OSError:
+            st, file_key = None, settings
+        # 输入与设置都没变、输出仍在时不解码，直接跳过
+        if not args.force and st and manifest.up_to_date(key, src, dst, file_key, st):
+            skipped += 1
+            continue
+        pending[src] = (key, file_key, st)
+        tasks.append((src, dst, index))
+    if skipped:
+        print(f"跳过 {skipped} 张未变化的图片（--force 全部重新生成）")
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    # 图片比进程少时不多开进程；只有一张时不启动进程池
+    workers = min(workers, len(tasks))
+    results = []
+    timings = open_timings(args.timings)
+    start = time.perf_counter()
+    try:
+        for i, r in enumerate(
+            run_batch(
+                tasks,
+                wm_base,
+                params,
+                save_options,
+                workers,
+                args.max_inflight,
+                args.max_megapixels,
+                record=timings is not None,
+            ),
+            1,
+        ):
+            results.append(r)
+            if timings is not None:
+                write_timing(timings, r)
+            if r.error:
+                failed += 1
+                print(f"[{i}/{len(tasks)}] 失败 {r.src}：{r.error}", file=sys.stderr)
+                continue
+            print(f"[{i}/{len(tasks)}] {r.src} -> {r.dst}")
+            key, file_key, st = pending[r.src]
+            try:
+                manifest.record(key, r.src, file_key, st)
+            except OSError:
+                pass
+            manifest.save()
+    finally:
+        manifest.save(force=True)
+    elapsed = time.perf_counter() - start
+    if timings not in (None, sys.stdout):
+        timings.close()
+    print(f"完成 {len(files) - failed}/{len(files)}，用时 {elapsed:.1f}s")
+    if args.stats:
+        print(format_worker_stats(results, elapsed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,615 @@
+"""性能基准：用合成图片与内置字体在独立子进程中测量各环节的耗时、峰值内存与分配
+
+    python watermark.py bench                       # 默认：8K 图片上新旧合成路径对比
+    python watermark.py bench composite composite-legacy --size 7680x4320 --format jpg
+    python watermark.py bench --suite --json base.json              # 全部环节 × 多种尺寸
+    python watermark.py bench display preview --size 1mp,24mp,100mp --rotation 0,30
+    python watermark.py bench --compare base.json new.json          # 对比两次结果
+
+每个用例在新的子进程中运行，先生成输入，再只对被测环节计时并记录峰值
+RSS 的增量（Linux 上通过 /proc/self/clear_refs 重置峰值，其它平台退回
+ru_maxrss），因此不同用例之间互不影响。计时之后再单独运行一次，统计
+Pillow 新建的图像数与内存块数（Image.core.get_stats）以及 Python 侧的
+峰值分配（tracemalloc），不影响计时结果。
+"""
+import argparse
+import atexit
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+SIZES = {
+    "1mp": (1224, 816),
+    "12mp": (4240, 2832),
+    "24mp": (6000, 4000),
+    "8k": (7680, 4320),
+    "50mp": (8688, 5792),
+    "100mp": (12288, 8192),
+}
+# 界面画布尺寸（display/preview 用例按此缩放）
+CANVAS_SIZE = (900, 600)
+
+
+# ---------- 合成输入 ----------
+def synthetic_image(size, mode="RGB"):
+    """原地平铺噪声小块生成的测试图（生成过程不产生额外的整图缓冲）"""
+    noise = Image.effect_noise((256, 256), 64)
+    tile = Image.merge(
+        "RGB", (noise, noise.transpose(Image.ROTATE_90), Image.linear_gradient("L"))
+    )
+    img = Image.new(mode, size)
+    for y in range(0, size[1], 256):
+        for x in range(0, size[0], 256):
+            img.paste(tile, (x, y))
+    return img
+
+
+def synthetic_logo(size=(1600, 600)):
+    logo = Image.new("RGBA", size, (0, 0, 0, 0))
+    inner = Image.new("RGBA", (size[0] - 40, size[1] - 40), (255, 255, 255, 200))
+    logo.paste(inner, (20, 20))
+    return logo
+
+
+# ---------- 用例 ----------
+# 每个用例接收解析后的参数，完成输入准备后返回被测函数 work()
+def case_composite_legacy(args):
+    """原 save_result：整图 RGBA 拷贝 + split/lambda point + paste + JPG 整图铺底"""
+    base = synthetic_image(args.size, "RGBA")
+    wm_base = synthetic_logo()
+
+    def work():
+        w = max(1, int(round(wm_base.width * args.scale)))
+        h = max(1, int(round(wm_base.height * args.scale)))
+        wm = wm_base.resize((w, h), Image.LANCZOS)
+        if abs(args.rotation) > 0.001:
+            wm = wm.rotate(-args.rotation, expand=True, resample=Image.BICUBIC)
+        alpha = wm.split()[3].point(lambda p: int(p * args.opacity))
+        wm.putalpha(alpha)
+        result = base.convert("RGBA").copy()
+        result.paste(wm, (base.width // 3, base.height // 3), wm)
+        if args.format == "jpg":
+            bg = Image.new("RGB", result.size, (255, 255, 255))
+            bg.paste(result, mask=result.split()[3])
+
+    return work
+
+
+def case_composite(args):
+    """wm_composite：查表透明度，只混合水印区域；RGB 底图保持 RGB"""
+    from wm_composite import composite_into, flatten_alpha
+    from wm_core import render_watermark
+
+    base = synthetic_image(args.size, args.mode)
+    wm_base = synthetic_logo()
+
+    def work():
+        wm = render_watermark(wm_base, args.scale, args.rotation, args.opacity)
+        composite_into(base, wm, (base.width // 3, base.height // 3))
+        if args.format == "jpg":
+            flatten_alpha(base)
+
+    return work
+
+
+def _temp_output(args):
+    fd, path = tempfile.mkstemp(suffix="." + args.format)
+    os.close(fd)
+    atexit.register(os.remove, path)
+    return path
+
+
+def case_save_legacy(args):
+    """原界面导出：RGBA 原图整图拷贝合成后编码写文件"""
+    path = _temp_output(args)
+    base = synthetic_image(args.size, "RGBA")
+    wm_base = synthetic_logo()
+
+    def work():
+        w = max(1, int(round(wm_base.width * args.scale)))
+        h = max(1, int(round(wm_base.height * args.scale)))
+        wm = wm_base.resize((w, h), Image.LANCZOS)
+        if abs(args.rotation) > 0.001:
+            wm = wm.rotate(-args.rotation, expand=True, resample=Image.BICUBIC)
+        alpha = wm.split()[3].point(lambda p: int(p * args.opacity))
+        wm.putalpha(alpha)
+        result = base.convert("RGBA").copy()
+        result.paste(wm, (base.width // 3, base.height // 3), wm)
+        if args.format == "jpg":
+            bg = Image.new("RGB", result.size, (255, 255, 255))
+            bg.paste(result, mask=result.split()[3])
+            bg.save(path, quality=95)
+        else:
+            result.save(path)
+
+    return work
+
+
+def case_save(args):
+    """watermark_applied：只备份/合成水印区域，原地导出后恢复"""
+    from wm_core import render_cache, save_image, watermark_applied
+
+    path = _temp_output(args)
+    base = synthetic_image(args.size, args.mode)
+    wm_base = synthetic_logo()
+    center = (base.width // 2, base.height // 2)
+
+    def work():
+        # 与 save-legacy 一样每次都渲染水印，不让重复运行命中渲染缓存
+        render_cache.clear()
+        with watermark_applied(
+            base, wm_base, center, args.scale, args.rotation, args.opacity
+        ) as result:
+            save_image(result, path, profile=args.profile)
+
+    return work
+
+
+def _input_file(args):
+    """把合成底图按 --format 编码成临时文件，供解码类用例读取"""
+    from wm_core import save_image
+
+    path = _temp_output(args)
+    save_image(synthetic_image(args.size), path, profile="fast")
+    return path
+
+
+def _display_scale(size):
+    return min(CANVAS_SIZE[0] / size[0], CANVAS_SIZE[1] / size[1], 1.0)
+
+
+def case_display_legacy(args):
+    """原 open_base_image + update_display_image：整图解码转 RGBA 后 LANCZOS 缩小"""
+    path = _input_file(args)
+
+    def work():
+        img = Image.open(path).convert("RGBA")
+        s = _display_scale(img.size)
+        img.resize((int(img.width * s), int(img.height * s)), Image.LANCZOS)
+
+    return work
+
+
+def case_display(args):
+    """open_preview（draft/reduce）+ update_display_image 的精确缩放"""
+    from wm_core import open_preview
+
+    path = _input_file(args)
+
+    def work():
+        preview, size = open_preview(path, CANVAS_SIZE)
+        s = _display_scale(size)
+        preview.resize((int(size[0] * s), int(size[1] * s)), Image.LANCZOS)
+
+    return work
+
+
+def _drag_rotations(args, steps=20):
+    """模拟拖动旋转滑块：从 --rotation 开始每步 1 度"""
+    return [args.rotation + i for i in range(steps)]
+
+
+def case_preview_legacy(args):
+    """原 get_wm_render_for_canvas：每次交互 LANCZOS 缩放 + BICUBIC 旋转 + lambda point"""
+    wm_base = synthetic_logo()
+    scale = args.scale * _display_scale(args.size)
+
+    def work():
+        for rotation in _drag_rotations(args):
+            w = max(1, int(round(wm_base.width * scale)))
+            h = max(1, int(round(wm_base.height * scale)))
+            wm = wm_base.resize((w, h), Image.LANCZOS)
+            wm = wm.rotate(-rotation, expand=True, resample=Image.BICUBIC)
+            alpha = wm.split()[3].point(lambda p: int(p * args.opacity))
+            wm.putalpha(alpha)
+
+    return work
+
+
+def case_preview(args):
+    """StagedRenderer：拖动过程中快速渲染，停止后一次高质量渲染"""
+    from wm_core import StagedRenderer
+
+    wm_base = synthetic_logo()
+    scale = args.scale * _display_scale(args.size)
+
+    def work():
+        renderer = StagedRenderer()
+        for rotation in _drag_rotations(args):
+            renderer.render(wm_base, scale, rotation, args.opacity, fast=True)
+        renderer.render(wm_base, scale, rotation, args.opacity)
+
+    return work
+
+
+def case_render(args):
+    """原图分辨率的水印渲染（缩放 + 旋转 + 透明度），不经过缓存"""
+    from wm_core import render_watermark
+
+    wm_base = synthetic_logo()
+
+    def work():
+        render_watermark(wm_base, args.scale, args.rotation, args.opacity)
+
+    return work
+
+
+def _bench_texts(n=20):
+    return [f"© Watermark Pro {i:03d}" for i in range(n)]
+
+
+def case_text(args):
+    """create_text_watermark：清空缓存后渲染一组不同的文字（含字体加载）"""
+    from wm_core import create_text_image
+    from wm_fonts import clear_text_cache
+
+    def work():
+        clear_text_cache()
+        for text in _bench_texts():
+            create_text_image(text, args.font_size, font=args.font)
+
+    return work
+
+
+def case_text_cached(args):
+    """重复生成相同文字：命中字体与文字位图缓存"""
+    from wm_core import create_text_image
+
+    for text in _bench_texts():
+        create_text_image(text, args.font_size, font=args.font)
+
+    def work():
+        for text in _bench_texts():
+            create_text_image(text, args.font_size, font=args.font)
+
+    return work
+
+
+def case_encode(args):
+    """只编码写文件（不合成水印），按 --format/--profile"""
+    from wm_core import save_image
+
+    path = _temp_output(args)
+    base = synthetic_image(args.size, args.mode)
+
+    def work():
+        save_image(base, path, profile=args.profile)
+
+    return work
+
+
+def case_startup(args):
+    """冷启动：新进程运行 watermark.py batch 处理一张小图（含解释器与模块导入）"""
+    from wm_core import save_image
+
+    fd, src = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    atexit.register(os.remove, src)
+    save_image(synthetic_image((640, 480)), src, profile="fast")
+    out_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, out_dir, True)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watermark.py")
+    cmd = [sys.executable, script, "batch", src, "-o", out_dir, "--force"]
+    cmd += ["--text", "© Startup", "--font", args.font]
+
+    def work():
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+    return work
+
+
+CASES = {
+    "display-legacy": case_display_legacy,
+    "display": case_display,
+    "preview-legacy": case_preview_legacy,
+    "preview": case_preview,
+    "render": case_render,
+    "text": case_text,
+    "text-cached": case_text_cached,
+    "composite-legacy": case_composite_legacy,
+    "composite": case_composite,
+    "encode": case_encode,
+    "save-legacy": case_save_legacy,
+    "save": case_save,
+    "startup": case_startup,
+}
+DEFAULT_CASES = ["composite-legacy", "composite", "save-legacy", "save"]
+# --suite：界面各环节的新路径，在以下尺寸上各跑一遍
+SUITE_CASES = ["display", "preview", "render", "text", "composite", "encode", "save", "startup"]
+SUITE_SIZES = ["1mp", "24mp", "100mp"]
+# 各用例受哪些参数影响；矩阵只在这些参数上展开，其余取第一个值
+CASE_AXES = {
+    "display-legacy": ("size", "format"),
+    "display": ("size", "format"),
+    "preview-legacy": ("size", "scale", "rotation"),
+    "preview": ("size", "scale", "rotation"),
+    "render": ("scale", "rotation"),
+    "text": (),
+    "text-cached": (),
+    "composite-legacy": ("size", "scale", "rotation", "format"),
+    "composite": ("size", "scale", "rotation", "format"),
+    "encode": ("size", "format"),
+    "save-legacy": ("size", "scale", "rotation", "format"),
+    "save": ("size", "scale", "rotation", "format"),
+    "startup": (),
+}
+AXES = ("size", "scale", "rotation", "format")
+
+
+# ---------- 测量 ----------
+def _read_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            m = re.search(field + r":\s+(\d+)", f.read())
+        return int(m.group(1)) if m else None
+    except OSError:
+        return None
+
+
+def _reset_peak_rss():
+    """重置峰值 RSS，成功返回 True（仅 Linux）"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _maxrss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _pil_stats():
+    try:
+        return Image.core.get_stats()
+    except AttributeError:  # 旧版 Pillow 没有分配统计
+        return None
+
+
+def measure_allocations(work):
+    """单独运行一次 work()：Pillow 新建图像/内存块数与 Python 峰值分配"""
+    before = _pil_stats()
+    tracemalloc.start()
+    try:
+        work()
+        py_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    after = _pil_stats()
+    result = {"py_peak_kb": round(py_peak / 1024.0, 1)}
+    if before is not None and after is not None:
+        result["pil_images"] = after["new_count"] - before["new_count"]
+        result["pil_blocks"] = after["allocated_blocks"] - before["allocated_blocks"]
+    return result
+
+
+def measure(work, repeat=1):
+    """运行 work()，返回 {seconds, peak_mb}；seconds 取 repeat 次中最快的一次"""
+    best = None
+    peak_kb = None
+    for _ in range(repeat):
+        if _reset_peak_rss():
+            start_kb = _read_status_kb("VmRSS")
+            t = time.perf_counter()
+            work()
+            elapsed = time.perf_counter() - t
+            extra = _read_status_kb("VmHWM") - start_kb
+        else:
+            start_kb = _maxrss_kb()
+            t = time.perf_counter()
+            work()
+            elapsed = time.perf_counter() - t
+            extra = None if start_kb is None else _maxrss_kb() - start_kb
+        best = elapsed if best is None else min(best, elapsed)
+        if extra is not None:
+            peak_kb = extra if peak_kb is None else max(peak_kb, extra)
+    return {
+        "seconds": round(best, 4),
+        "peak_mb": None if peak_kb is None else round(peak_kb / 1024.0, 1),
+    }
+
+
+def run_case_in_subprocess(name, argv):
+    """在新进程中运行单个用例，返回结果 dict"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name] + argv
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode != 0:
+        return {"case": name, "error": out.stderr.strip().splitlines()[-1:]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    """结果文件中记录的运行环境，便于对比不同提交/机器"""
+    import PIL
+
+    env = {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        env["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip() or None
+    except OSError:
+        env["commit"] = None
+    return env
+
+
+# ---------- 结果对比 ----------
+def result_key(r):
+    return (r["case"], r.get("size"), r.get("scale"), r.get("rotation"), r.get("format"))
+
+
+def compare_results(old_path, new_path, threshold=0.1):
+    """逐项对比两个 JSON 结果，返回 (表格文本, 变慢超过 threshold 的项数)"""
+    with open(old_path, encoding="utf-8") as f:
+        old = {result_key(r): r for r in json.load(f)["results"] if "error" not in r}
+    with open(new_path, encoding="utf-8") as f:
+        new = [r for r in json.load(f)["results"] if "error" not in r]
+    lines = [
+        f"{'case':<17} {'size':>11} {'scale':>5} {'rot':>5} {'fmt':>4} "
+        f"{'old s':>8} {'new s':>8} {'Δ':>7} {'old MB':>7} {'new MB':>7}"
+    ]
+    regressions = 0
+    for r in new:
+        o = old.get(result_key(r))
+        if o is None:
+            continue
+        change = (r["seconds"] - o["seconds"]) / o["seconds"] if o["seconds"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  ← 变慢"
+        lines.append(
+            f"{r['case']:<17} {r['size']:>11} {r['scale']:>5} {r['rotation']:>5} "
+            f"{r['format']:>4} {o['seconds']:>8.3f} {r['seconds']:>8.3f} {change:>+7.1%} "
+            f"{_fmt_mb(o.get('peak_mb')):>7} {_fmt_mb(r.get('peak_mb')):>7}{flag}"
+        )
+    return "\n".join(lines), regressions
+
+
+def _fmt_mb(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+# ---------- 命令行 ----------
+def parse_size(text):
+    text = text.lower()
+    if text in SIZES:
+        return SIZES[text]
+    w, _, h = text.partition("x")
+    return int(w), int(h)
+
+
+def comma_list(convert):
+    """逗号分隔的多个取值，如 --size 1mp,24mp --rotation 0,30"""
+    return lambda text: [convert(v) for v in text.split(",") if v]
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="watermark.py bench", description="水印渲染/合成性能基准（合成图片，无需网络）"
+    )
+    parser.add_argument("cases", nargs="*", help="用例名：" + ", ".join(CASES))
+    parser.add_argument("--suite", action="store_true", help="运行完整套件：" + ", ".join(SUITE_CASES))
+    parser.add_argument("--size", type=comma_list(parse_size), help="底图尺寸，可多个：1mp,12mp,24mp,8k,50mp,100mp 或 7680x4320")
+    parser.add_argument("--mode", choices=["RGB", "RGBA"], default="RGB", help="新路径的底图模式")
+    parser.add_argument("--format", type=comma_list(str), default=["jpg"], help="文件格式（png/jpg/webp），可多个")
+    parser.add_argument("--profile", choices=["fast", "default", "small"], default="default", help="编码配置")
+    parser.add_argument("--scale", type=comma_list(float), default=[1.0], help="水印缩放，可多个")
+    parser.add_argument("--rotation", type=comma_list(float), default=[30.0], help="旋转角度，可多个")
+    parser.add_argument("--opacity", type=float, default=0.6)
+    parser.add_argument("--font-size", type=int, default=72, help="text 用例的字体大小")
+    parser.add_argument("--font", default="builtin", help="text 用例的字体（默认 Pillow 内置字体，与系统无关）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数（取最快）")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两个 JSON 结果")
+    parser.add_argument("--threshold", type=float, default=0.1, help="--compare 时视为变慢的比例")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser
+
+
+def _child_main(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for axis in AXES:
+        setattr(args, axis, getattr(args, axis)[0])
+    work = CASES[args.child](args)
+    result = measure(work, args.repeat)
+    result.update(measure_allocations(work))
+    result.update(
+        case=args.child,
+        size="x".join(map(str, args.size)),
+        scale=args.scale,
+        rotation=args.rotation,
+        format=args.format,
+    )
+    print(json.dumps(result))
+    return 0
+
+
+def expand_matrix(name, args):
+    """用例在其相关参数上的所有组合，每个组合是一份子进程参数"""
+    axes = CASE_AXES[name]
+    values = [getattr(args, a) if a in axes else getattr(args, a)[:1] for a in AXES]
+    for size, scale, rotation, fmt in itertools.product(*values):
+        yield [
+            "--size", "x".join(map(str, size)),
+            "--scale", str(scale),
+            "--rotation", str(rotation),
+            "--format", fmt,
+            "--mode", args.mode,
+            "--profile", args.profile,
+            "--opacity", str(args.opacity),
+            "--font-size", str(args.font_size),
+            "--font", args.font,
+            "--repeat", str(args.repeat),
+        ]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_arg_parser().parse_args(argv)
+    if args.size is None:
+        args.size = [SIZES[s] for s in SUITE_SIZES] if args.suite else [SIZES["8k"]]
+    if args.child:
+        return _child_main(args)
+    if args.compare:
+        table, regressions = compare_results(*args.compare, threshold=args.threshold)
+        print(table)
+        if regressions:
+            print(f"{regressions} 项变慢超过 {args.threshold:.0%}", file=sys.stderr)
+        return 1 if regressions else 0
+    names = args.cases or (SUITE_CASES if args.suite else DEFAULT_CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        print(f"未知用例：{', '.join(unknown)}", file=sys.stderr)
+        return 2
+    results = []
+    print(
+        f"{'case':<17} {'size':>11} {'scale':>5} {'rot':>5} {'fmt':>4} "
+        f"{'seconds':>8} {'peak MB':>8} {'PIL img':>7} {'blocks':>6} {'py KB':>8}"
+    )
+    for name in names:
+        for child_argv in expand_matrix(name, args):
+            r = run_case_in_subprocess(name, child_argv)
+            results.append(r)
+            if "error" in r:
+                print(f"{name:<17} 失败：{r['error']}")
+                continue
+            print(
+                f"{name:<17} {r['size']:>11} {r['scale']:>5} {r['rotation']:>5} "
+                f"{r['format']:>4} {r['seconds']:>8.3f} {_fmt_mb(r['peak_mb']):>8} "
+                f"{r.get('pil_images', '-'):>7} {r.get('pil_blocks', '-'):>6} "
+                f"{r['py_peak_kb']:>8.1f}"
+            )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""水印合成：查表法应用透明度，只在水印覆盖的区域内原地混合
+
+整张底图既不转换成 RGBA 也不整体拷贝；水印之外的像素不会被读写。
+"""
+import contextlib
+import functools
+
+from PIL import Image
+
+from wm_profile import stage
+
+
+@functools.lru_cache(maxsize=256)
+def opacity_lut(alpha):
+    """alpha 通道乘以 alpha/255 的查找表（point 直接在 C 层查表）"""
+    return [p * alpha // 255 for p in range(256)]
+
+
+def apply_opacity(wm, opacity, inplace=False):
+    """alpha 通道乘以 opacity；inplace=False 时返回新图，不修改 wm"""
+    alpha = int(round(max(0.0, min(1.0, opacity)) * 255))
+    if alpha >= 255:
+        return wm
+    # getchannel 只拷贝 alpha 一个通道（split 会拷贝全部四个）
+    band = wm.getchannel("A").point(opacity_lut(alpha))
+    out = wm if inplace else wm.copy()
+    out.putalpha(band)
+    return out
+
+
+def composite_mode(img):
+    """合成时底图应使用的模式：RGB/RGBA 保持不变，其余按是否有透明度转换"""
+    if img.mode in ("RGB", "RGBA"):
+        return img.mode
+    if img.mode in ("LA", "PA", "La") or "transparency" in img.info:
+        return "RGBA"
+    return "RGB"
+
+
+def clip_box(base_size, pos, size):
+    """水印 (pos, size) 与底图的重叠区域：返回 (底图上的 box, 水印上的 box) 或 None"""
+    x, y = pos
+    left, top = max(0, x), max(0, y)
+    right = min(base_size[0], x + size[0])
+    bottom = min(base_size[1], y + size[1])
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right, bottom), (left - x, top - y, right - x, bottom - y)
+
+
+def composite_into(base, wm, pos):
+    """把 RGBA 水印 wm 以 pos 为左上角原地混合进 base，返回改动区域 box 或 None"""
+    boxes = clip_box(base.size, pos, wm.size)
+    if boxes is None:
+        return None
+    box, src_box = boxes
+    tile = wm if src_box == (0, 0) + wm.size else wm.crop(src_box)
+    if base.mode == "RGBA":
+        base.alpha_composite(tile, box[:2])
+    else:
+        # 不透明底图：以水印 alpha 作 mask 混合即为正确的 over 结果
+        base.paste(tile, box[:2], tile)
+    return box
+
+
+def composite_tiles(base, wm, positions):
+    """同一张已渲染好的水印在多个位置原地混合（平铺），不再逐个变换"""
+    for pos in positions:
+        composite_into(base, wm, pos)
+
+
+@contextlib.contextmanager
+def composited_region(base, wm, pos):
+    """临时把 wm 原地混合进 base，退出时恢复原像素
+
+    只备份水印覆盖的区域，额外内存与水印大小相关而与底图大小无关；
+    适用于底图还要继续使用（如界面中保留的原图）但只需导出一次结果的场景。
+    """
+    boxes = clip_box(base.size, pos, wm.size)
+    if boxes is None:
+        yield base
+        return
+    box = boxes[0]
+    with stage("备份区域") as st:
+        backup = st.note(base.crop(box))
+    try:
+        with stage("合成") as st:
+            st.note(wm)
+            composite_into(base, wm, pos)
+        yield base
+    finally:
+        with stage("恢复区域"):
+            base.paste(backup, box[:2])
+
+
+def flatten_alpha(img, background=(255, 255, 255)):
+    """JPG 等不支持 alpha 的格式：合并到纯色背景，RGB 图直接返回"""
+    if img.mode == "RGB":
+        return img
+    if img.mode != "RGBA":
+        return img.convert("RGB")
+    bg = Image.new("RGB", img.size, background)
+    # mask 直接使用 RGBA 图（取其 alpha），不额外拆分通道
+    bg.paste(img, mask=img)
+    return bg
@@ -0,0 +1,616 @@
+"""水印渲染核心：纯 Pillow 实现，不依赖 tkinter，供图形界面与命令行批处理共用"""
+import collections
+import contextlib
+import math
+import os
+import threading
+import weakref
+
+from PIL import Image
+
+from wm_composite import (
+    apply_opacity,
+    composite_into,
+    composite_mode,
+    composite_tiles,
+    composited_region,
+    flatten_alpha,
+)
+from wm_fonts import render_text
+from wm_profile import stage
+
+JPEG_EXTS = (".jpg", ".jpeg")
+TIFF_EXTS = (".tif", ".tiff")
+# 扩展名 -> Pillow 格式名
+SAVE_FORMATS = {
+    ".png": "PNG",
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".webp": "WEBP",
+    ".avif": "AVIF",
+    ".tif": "TIFF",
+    ".tiff": "TIFF",
+    ".bmp": "BMP",
+}
+# 编码配置：按格式给出编码参数，在 CPU 时间与输出字节数之间取舍
+ENCODER_PROFILES = {
+    "default": {
+        "PNG": {},
+        "JPEG": {"quality": 95},
+        "WEBP": {"quality": 90, "method": 4},
+        "AVIF": {"quality": 80},
+    },
+    "fast": {
+        "PNG": {"compress_level": 1},
+        "JPEG": {"quality": 90, "subsampling": "4:2:0"},
+        "WEBP": {"quality": 85, "method": 0},
+        "AVIF": {"quality": 75, "speed": 10},
+    },
+    "small": {
+        "PNG": {"compress_level": 9, "optimize": True},
+        "JPEG": {
+            "quality": 85,
+            "subsampling": "4:2:0",
+            "optimize": True,
+            "progressive": True,
+        },
+        "WEBP": {"quality": 80, "method": 6},
+        "AVIF": {"quality": 60, "speed": 4},
+    },
+}
+# 能写入 EXIF / ICC 的格式
+METADATA_FORMATS = ("JPEG", "PNG", "WEBP", "AVIF", "TIFF")
+# 超过该像素数时不使用需要整图缓冲的编码选项（渐进式/优化 JPEG）
+LARGE_IMAGE_PIXELS = 40_000_000
+# 平铺模式默认参数：间距（相对水印尺寸）、错行比例、行方向角度（None 表示跟随水印旋转）
+DEFAULT_TILE = {"spacing": 0.5, "stagger": 0.5, "angle": None}
+MAX_TILES = 100_000
+# 图层栈中的一层：参数与 apply_watermark 相同，列表中靠后的层在上面
+Layer = collections.namedtuple(
+    "Layer",
+    "wm_base center scale rotation opacity tile",
+    defaults=(None, 1.0, 0.0, 1.0, None),
+)
+
+
+# ---------- 水印基础图 ----------
+def create_text_image(text, font_size, fill=(255, 255, 255, 255), font=None):
+    """把文字渲染成带透明背景的水印基础图 (RGBA)
+
+    结果按 (文字, 字体, 大小, 颜色) 缓存并共享，调用方不要原地修改。
+    """
+    return render_text(text, font_size, fill, font)
+
+
+def load_watermark_image(path):
+    """读取图片水印，强制带 alpha 通道"""
+    with Image.open(path) as im:
+        return im.convert("RGBA")
+
+
+# ---------- 水印变换与合成 ----------
+def scaled_size(size, scale):
+    return max(1, int(size[0] * scale)), max(1, int(size[1] * scale))
+
+
+def rotated_size(size, rotation):
+    """与 render 中 rotate(-rotation, expand=True) 输出尺寸一致，但不实际渲染"""
+    w, h = size
+    if abs(rotation) <= 0.001:
+        return w, h
+    # 以下与 Pillow Image.rotate 的 expand 尺寸计算保持一致
+    angle = -rotation % 360.0
+    if angle in (0.0, 180.0):
+        return w, h
+    if angle in (90.0, 270.0):
+        return h, w
+    a = -math.radians(angle)
+    cos_a, sin_a = round(math.cos(a), 15), round(math.sin(a), 15)
+    cx, cy = w / 2.0, h / 2.0
+    tx = -cos_a * cx - sin_a * cy + cx
+    ty = sin_a * cx - cos_a * cy + cy
+    xs, ys = [], []
+    for x, y in ((0, 0), (w, 0), (w, h), (0, h)):
+        xs.append(cos_a * x + sin_a * y + tx)
+        ys.append(-sin_a * x + cos_a * y + ty)
+    return (
+        math.ceil(max(xs)) - math.floor(min(xs)),
+        math.ceil(max(ys)) - math.floor(min(ys)),
+    )
+
+
+def point_in_rotated_rect(point, center, size, rotation):
+    """point 是否落在以 center 为中心、尺寸 size、顺时针旋转 rotation 度的矩形内"""
+    dx = point[0] - center[0]
+    dy = point[1] - center[1]
+    # 把点逆向旋转回水印自身坐标系
+    a = math.radians(rotation)
+    u = dx * math.cos(a) + dy * math.sin(a)
+    v = -dx * math.sin(a) + dy * math.cos(a)
+    return abs(u) <= size[0] / 2.0 and abs(v) <= size[1] / 2.0
+
+
+def render_watermark(wm_base, scale=1.0, rotation=0.0, opacity=1.0):
+    """基于 wm_base 按 缩放/旋转/透明度 生成最终水印 (RGBA)，不修改 wm_base"""
+    with stage("缩放") as st:
+        wm = st.note(wm_base.resize(scaled_size(wm_base.size, scale), Image.LANCZOS))
+    # 旋转（expand 后尺寸会变大，定位时以中心为准）
+    if abs(rotation) > 0.001:
+        with stage("旋转") as st:
+            wm = st.note(wm.rotate(-rotation, expand=True, resample=Image.BICUBIC))
+    # 应用透明度（乘到 alpha 通道）；wm 是新生成的中间图，可原地修改
+    with stage("透明度") as st:
+        return st.note(apply_opacity(wm, opacity, inplace=True))
+
+
+class StagedRenderer:
+    """交互预览用的分阶段渲染：缩放 -> 旋转 -> 透明度
+
+    每个阶段缓存上一次的输入与结果，只重做输入发生变化的阶段（例如只拖动
+    透明度滑块时不再重新缩放和旋转）。fast=True 时使用低质量快速重采样，
+    供拖动滑块过程中使用，停止后再以 fast=False 渲染一次高质量结果。
+    """
+
+    def __init__(self):
+        self._resized = (None, None)
+        self._rotated = (None, None)
+        self._final = (None, None)
+        self._source = None
+
+    def render(self, wm_base, scale, rotation, opacity, fast=False):
+        if self._source is None or self._source() is not wm_base:
+            self._source = weakref.ref(wm_base)
+            self._resized = self._rotated = self._final = (None, None)
+
+        size = scaled_size(wm_base.size, scale)
+        key = (size, fast)
+        if self._resized[0] != key:
+            resample = Image.BILINEAR if fast else Image.LANCZOS
+            with stage("缩放") as st:
+                self._resized = (key, st.note(wm_base.resize(size, resample)))
+
+        rotation = round(rotation, 1)
+        key = (key, rotation)
+        if self._rotated[0] != key:
+            wm = self._resized[1]
+            if abs(rotation) > 0.001:
+                resample = Image.NEAREST if fast else Image.BICUBIC
+                with stage("旋转") as st:
+                    wm = st.note(wm.rotate(-rotation, expand=True, resample=resample))
+            self._rotated = (key, wm)
+
+        key = (key, int(round(max(0.0, min(1.0, opacity)) * 255)))
+        if self._final[0] != key:
+            with stage("透明度") as st:
+                wm = st.note(apply_opacity(self._rotated[1], key[1] / 255.0))
+            self._final = (key, wm)
+        return self._final[1]
+
+
+def quantize_params(scale, rotation, opacity):
+    """把渲染参数量化，使滑块抖动/浮点误差得到同一个缓存键"""
+    rotation = round(rotation, 1) % 360.0
+    if rotation > 180.0:
+        rotation -= 360.0
+    return round(scale, 4), rotation, int(round(max(0.0, min(1.0, opacity)) * 255))
+
+
+class RenderCache:
+    """最终水印 (RGBA) 的 LRU 缓存，按图像字节数限制总大小
+
+    键为 (水印基础图身份, 量化后的 scale/rotation/opacity)，同一组参数的
+    LANCZOS 缩放、BICUBIC 旋转与 alpha 处理只做一次。返回的图像会被共享，
+    调用方不要原地修改。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, wm_base, scale=1.0, rotation=0.0, opacity=1.0):
+        scale, rotation, alpha = quantize_params(scale, rotation, opacity)
+        # 用 id 标识水印基础图，并用弱引用核对，防止对象回收后 id 被复用
+        key = (id(wm_base), scale, rotation, alpha)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0]() is wm_base:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        wm = render_watermark(wm_base, scale, rotation, alpha / 255.0)
+        nbytes = wm.width * wm.height * len(wm.getbands())
+        if nbytes > self.max_bytes:
+            return wm
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._items[key] = (weakref.ref(wm_base), wm, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+        return wm
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._items),
+            "bytes": self._bytes,
+        }
+
+
+# 进程内共享的默认缓存（批处理的每个 worker 进程各有一份，处理多张图时保持预热）
+render_cache = RenderCache()
+
+
+def get_render(wm_base, scale=1.0, rotation=0.0, opacity=1.0):
+    """带缓存的 render_watermark"""
+    return render_cache.get(wm_base, scale, rotation, opacity)
+
+
+def paste_position(center, size):
+    """水印中心 -> 粘贴左上角坐标"""
+    return center[0] - size[0] // 2, center[1] - size[1] // 2
+
+
+def tile_positions(base_size, tile_size, step, center, angle=0.0, stagger=0.5):
+    """平铺格点：返回与底图相交的每个水印的左上角坐标
+
+    格点以 center 为原点，行方向沿 angle 度（与水印旋转同向，顺时针），
+    step 为 (行内间距, 行间距)，第 j 行沿行方向错开 j*stagger 个行内间距。
+    """
+    a = math.radians(angle)
+    ux, uy = math.cos(a) * step[0], math.sin(a) * step[0]
+    vx, vy = -math.sin(a) * step[1], math.cos(a) * step[1]
+    det = ux * vy - uy * vx
+    tw, th = tile_size
+    bw, bh = base_size
+    # 把（向外扩展半个水印的）底图四角换算成格点坐标，得到需要遍历的范围
+    ii, jj = [], []
+    for x, y in (
+        (-tw / 2.0, -th / 2.0),
+        (bw + tw / 2.0, -th / 2.0),
+        (bw + tw / 2.0, bh + th / 2.0),
+        (-tw / 2.0, bh + th / 2.0),
+    ):
+        dx, dy = x - center[0], y - center[1]
+        ii.append((dx * vy - dy * vx) / det)
+        jj.append((ux * dy - uy * dx) / det)
+    i_range = range(math.floor(min(ii)) - 1, math.ceil(max(ii)) + 1)
+    j_range = range(math.floor(min(jj)), math.ceil(max(jj)) + 1)
+    if len(i_range) * len(j_range) > MAX_TILES:
+        raise ValueError("平铺间距过小，水印数量过多")
+
+    positions = []
+    for j in j_range:
+        shift = (j * stagger) % 1.0
+        for i in i_range:
+            k = i + shift
+            x = int(round(center[0] + k * ux + j * vx)) - tw // 2
+            y = int(round(center[1] + k * uy + j * vy)) - th // 2
+            if x < bw and y < bh and x + tw > 0 and y + th > 0:
+                positions.append((x, y))
+    return positions
+
+
+def tile_layout(base_size, wm_base_size, center, scale, rotation, tile, wm_size):
+    """按平铺参数计算全部水印位置；wm_size 为旋转后水印渲染图的尺寸"""
+    tile = dict(DEFAULT_TILE, **tile)
+    sw, sh = scaled_size(wm_base_size, scale)
+    step = (
+        max(1.0, sw * (1.0 + tile["spacing"])),
+        max(1.0, sh * (1.0 + tile["spacing"])),
+    )
+    angle = rotation if tile["angle"] is None else tile["angle"]
+    return tile_positions(base_size, wm_size, step, center, angle, tile["stagger"])
+
+
+def _composite_watermark(result, wm, wm_base, center, scale, rotation, tile):
+    if tile is None:
+        # 越界部分会被裁掉
+        with stage("合成") as st:
+            st.note(wm)
+            composite_into(result, wm, paste_position(center, wm.size))
+    else:
+        positions = tile_layout(
+            result.size, wm_base.size, center, scale, rotation, tile, wm.size
+        )
+        with stage("平铺合成") as st:
+            st.note(wm)
+            composite_tiles(result, wm, positions)
+
+
+def convert_mode(img, mode):
+    """转换到合成用的模式，并去掉原图的 ICC 配置
+
+    ICC 描述的是原颜色空间（如 CMYK），不能再用于转换后的像素。
+    """
+    converted = img.convert(mode)
+    converted.info.pop("icc_profile", None)
+    return converted
+
+
+def _base_for_composite(base_img, inplace):
+    """合成用的底图：需要时转换模式，否则按 inplace 决定是否拷贝"""
+    mode = composite_mode(base_img)
+    if mode != base_img.mode:
+        with stage("转换模式") as st:
+            return st.note(convert_mode(base_img, mode))
+    if inplace:
+        return base_img
+    with stage("拷贝底图") as st:
+        return st.note(base_img.copy())
+
+
+def apply_layers(base_img, layers, inplace=False):
+    """按从下到上的顺序把多层水印合成到 base_img 上并返回结果图
+
+    layers 为 Layer 列表；整个图层栈只转换/拷贝底图一次，每层直接在结果上
+    混合自己覆盖的区域（或平铺），各层的渲染图分别取自渲染缓存。
+    """
+    result = _base_for_composite(base_img, inplace)
+    for layer in layers:
+        wm = get_render(layer.wm_base, layer.scale, layer.rotation, layer.opacity)
+        center = layer.center
+        if center is None:
+            center = (result.width // 2, result.height // 2)
+        _composite_watermark(
+            result, wm, layer.wm_base, center, layer.scale, layer.rotation, layer.tile
+        )
+    return result
+
+
+def apply_watermark(
+    base_img,
+    wm_base,
+    center=None,
+    scale=1.0,
+    rotation=0.0,
+    opacity=1.0,
+    inplace=False,
+    tile=None,
+):
+    """把水印合成到 base_img 上并返回结果图
+
+    center 为水印中心在原图上的像素坐标，None 表示居中；scale 以原图像素为准。
+    RGB/RGBA 底图保持原模式，只混合水印覆盖的区域；inplace=True 时直接修改
+    base_img（调用方拥有该图时使用，例如批处理刚解码的图片），否则先拷贝。
+    tile 为平铺参数 dict（见 DEFAULT_TILE），此时以 center 为格点原点铺满整图，
+    所有位置共用同一张渲染好的水印。
+    """
+    layer = Layer(wm_base, center, scale, rotation, opacity, tile)
+    return apply_layers(base_img, [layer], inplace)
+
+
+@contextlib.contextmanager
+def layers_applied(base_img, layers):
+    """临时把多层水印合成进 base_img（用于导出），退出 with 后恢复原图
+
+    与 apply_layers 不同，不拷贝整张底图，只按层依次备份各层覆盖的区域，
+    退出时按相反顺序恢复；需要转换模式或有平铺层时在拷贝上合成。
+    """
+    if composite_mode(base_img) != base_img.mode or any(
+        layer.tile is not None for layer in layers
+    ):
+        yield apply_layers(base_img, layers)
+        return
+    with contextlib.ExitStack() as backups:
+        for layer in layers:
+            wm = get_render(layer.wm_base, layer.scale, layer.rotation, layer.opacity)
+            center = layer.center
+            if center is None:
+                center = (base_img.width // 2, base_img.height // 2)
+            pos = paste_position(center, wm.size)
+            backups.enter_context(composited_region(base_img, wm, pos))
+        yield base_img
+
+
+@contextlib.contextmanager
+def watermark_applied(
+    base_img, wm_base, center=None, scale=1.0, rotation=0.0, opacity=1.0, tile=None
+):
+    """临时把水印合成进 base_img（用于导出），退出 with 后恢复原图
+
+    与 apply_watermark 不同，不拷贝整张底图，只备份水印覆盖区域；
+    RGB/RGBA 以外的模式需要先转换，此时在转换结果上合成，base_img 不变。
+    平铺模式会覆盖整张图，备份区域没有意义，直接在拷贝上合成。
+    """
+    layer = Layer(wm_base, center, scale, rotation, opacity, tile)
+    with layers_applied(base_img, [layer]) as result:
+        yield result
+
+
+# ---------- 打开与保存 ----------
+EXIF_ORIENTATION = 0x0112
+# EXIF 方向 -> 摆正所需的变换；5~8 需要转 90 度，宽高互换
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+
+def exif_orientation(img):
+    """已解码的图片在 EXIF 中的方向（1 为正常）
+
+    须在 convert()/reduce() 之前读取：新图不再带 TIFF 标签与 EXIF。
+    TIFF 解码时 Pillow 已经摆正并去掉了方向标签，这里得到 1。
+    """
+    return img.getexif().get(EXIF_ORIENTATION, 1)
+
+
+def oriented_size(img):
+    """按 EXIF 方向摆正后的尺寸，只读文件头
+
+    PNG 的 eXIf 块可能位于像素数据之后，未解码时不为读取它而整图解码。
+    """
+    if img.format == "PNG" and "exif" not in img.info:
+        return img.size
+    if exif_orientation(img) in (5, 6, 7, 8):
+        return img.height, img.width
+    return img.size
+
+
+def apply_orientation(img, orientation):
+    """按 EXIF 方向旋转/翻转像素，返回摆正的图片；方向正常时原样返回
+
+    相机竖拍的照片像素是横着存的；不摆正的话，保留的 EXIF 方向会让查看器
+    把水印连同照片一起转到侧面（导出时写入的方向见 image_metadata）。
+    """
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    if method is None:
+        return img
+    with stage("方向校正") as st:
+        return st.note(img.transpose(method))
+
+
+def open_image(path):
+    """读取图片并完成解码；RGB/RGBA 保持原模式，不再统一转成 RGBA；按 EXIF 方向摆正"""
+    img = Image.open(path)
+    mode = composite_mode(img)
+    with stage("解码") as st:
+        img.load()
+        orientation = exif_orientation(img)
+        if img.mode != mode:
+            img = convert_mode(img, mode)
+        st.note(img)
+    return apply_orientation(img, orientation)
+
+
+def open_preview(path, max_size):
+    """快速读取用于显示的缩小图，返回 (预览图, 原图尺寸)
+
+    JPEG 通过 draft() 让解码器直接按 1/2、1/4、1/8 缩小解码（只读文件头即可得到
+    原图尺寸）；其它格式解码后用整数倍 reduce() 缩小，比整图 LANCZOS 快得多。
+    返回的预览图不小于 max_size 对应的缩放尺寸，显示前仍需精确缩放一次。
+    预览图与原图尺寸都已按 EXIF 方向摆正。
+    """
+    img = Image.open(path)
+    full_size = oriented_size(img)
+    img.draft(None, max_size)
+    mode = composite_mode(img)
+    with stage("预览解码") as st:
+        img.load()
+        orientation = exif_orientation(img)
+        if img.mode != mode:
+            img = convert_mode(img, mode)
+        st.note(img)
+    factor = min(img.width // max_size[0], img.height // max_size[1])
+    if factor >= 2:
+        with stage("整数缩小") as st:
+            img = st.note(img.reduce(factor))
+    return apply_orientation(img, orientation), full_size
+
+
+def save_format(path):
+    """按扩展名确定编码格式，未知扩展名交给 Pillow 判断（返回 None）"""
+    return SAVE_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def avif_supported():
+    """AVIF 需要可选插件 pillow-avif-plugin（导入即注册编码器）"""
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    return "AVIF" in Image.SAVE
+
+
+def output_formats():
+    """可选的输出格式扩展名（不含点）"""
+    formats = ["png", "jpg", "webp"]
+    if avif_supported():
+        formats.append("avif")
+    return formats
+
+
+def image_metadata(img):
+    """原图中需要保留的元数据：EXIF 与 ICC 色彩配置
+
+    像素在解码时已按 EXIF 方向摆正（apply_orientation），写出的 EXIF 方向改为 1。
+    """
+    meta = {}
+    exif = img.info.get("exif")
+    if exif:
+        meta["exif"] = upright_exif(exif)
+    icc = img.info.get("icc_profile")
+    if icc:
+        meta["icc_profile"] = icc
+    return meta
+
+
+def upright_exif(data):
+    """把 EXIF 原始字节中的方向改为 1（正常）；没有方向标签时原样返回"""
+    exif = Image.Exif()
+    exif.load(data)
+    if exif.get(EXIF_ORIENTATION, 1) == 1:
+        return data
+    exif[EXIF_ORIENTATION] = 1
+    return exif.tobytes()
+
+
+def encoder_options(fmt, profile="default", quality=None):
+    """编码配置在该格式下的参数；quality 覆盖配置中的质量"""
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"未知的编码配置：{profile}（可选 {', '.join(ENCODER_PROFILES)}）")
+    options = dict(ENCODER_PROFILES[profile].get(fmt, {}))
+    if quality is not None and fmt in ("JPEG", "WEBP", "AVIF"):
+        options["quality"] = quality
+    return options
+
+
+def streaming_options(img, path, options):
+    """去掉大图上需要整图缓冲的编码选项，让编码器按块/条带写出
+
+    Pillow 的 PNG、基线 JPEG 与 TIFF 都按块写文件；但渐进式或 optimize 的
+    JPEG 需要与整图同量级的输出缓冲（libjpeg 还要缓存全部系数），因此大图
+    上退回基线编码。TIFF 按条带写出，条带大小由 strip_size 控制。
+    """
+    options = dict(options)
+    lower = path.lower()
+    if lower.endswith(JPEG_EXTS) and img.width * img.height > LARGE_IMAGE_PIXELS:
+        options.pop("progressive", None)
+        options.pop("optimize", None)
+    if lower.endswith(TIFF_EXTS):
+        options.setdefault("strip_size", 1 << 20)
+    return options
+
+
+def save_image(
+    img, path, quality=None, profile="default", metadata=None, fp=None, **options
+):
+    """按扩展名与编码配置保存，保留 EXIF/ICC；JPG 不支持 alpha，先合并到白色背景
+
+    metadata 默认取自 img.info；fp 为文件对象时写入 fp，path 只用于确定格式；
+    其余关键字参数直接传给编码器并覆盖配置。
+    """
+    fmt = save_format(path)
+    if fmt == "AVIF" and not avif_supported():
+        raise ValueError("保存 AVIF 需要安装 pillow-avif-plugin")
+    options = dict(encoder_options(fmt, profile, quality), **options)
+    if fmt in METADATA_FORMATS:
+        for key, value in (image_metadata(img) if metadata is None else metadata).items():
+            options.setdefault(key, value)
+    options = streaming_options(img, path, options)
+    if fmt == "JPEG" and img.mode != "RGB":
+        with stage("铺底") as st:
+            img = st.note(flatten_alpha(img))
+    with stage("编码") as st:
+        st.note(img)
+        img.save(path if fp is None else fp, format=fmt, **options)
@@ -0,0 +1,216 @@
+"""字体与文字水印渲染：系统字体只扫描一次，字体对象与文字位图都做缓存
+
+文字内容支持模板占位符，批处理时按每张图片展开，例如：
+    "© YourName {date}"、"{stem} · {mtime:%Y-%m-%d}"
+展开后的文字没有变化时直接复用已渲染的位图。
+"""
+import collections
+import datetime
+import functools
+import logging
+import os
+import sys
+
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+FONT_EXTS = (".ttf", ".ttc", ".otf")
+# 指定该名称时直接使用 Pillow 内置字体（与系统无关，基准测试用）
+BUILTIN_FONT = "builtin"
+# 默认字体优先级（小写文件名，不含扩展名）：先中文字体，再常见西文字体
+PREFERRED_FONTS = [
+    "simhei",
+    "msyh",
+    "pingfang",
+    "notosanscjksc-regular",
+    "notosanscjk-regular",
+    "wqy-microhei",
+    "wqy-zenhei",
+    "arial unicode",
+    "dejavusans",
+    "arial",
+]
+
+
+# ---------- 字体发现 ----------
+def font_dirs():
+    """可能存放字体的目录：打包目录、程序目录、当前目录与各平台系统字体目录"""
+    dirs = []
+    bundle = getattr(sys, "_MEIPASS", None)  # PyInstaller --add-data SimHei.ttf
+    if bundle:
+        dirs.append(bundle)
+    dirs.append(os.path.dirname(os.path.abspath(__file__)))
+    dirs.append(os.getcwd())
+    windir = os.environ.get("WINDIR")
+    if windir:
+        dirs.append(os.path.join(windir, "Fonts"))
+    local = os.environ.get("LOCALAPPDATA")
+    if local:
+        dirs.append(os.path.join(local, "Microsoft", "Windows", "Fonts"))
+    home = os.path.expanduser("~")
+    dirs += [
+        "/System/Library/Fonts",
+        "/Library/Fonts",
+        os.path.join(home, "Library", "Fonts"),
+        "/usr/share/fonts",
+        "/usr/local/share/fonts",
+        os.path.join(home, ".fonts"),
+        os.path.join(home, ".local", "share", "fonts"),
+    ]
+    return dirs
+
+
+@functools.lru_cache(maxsize=1)
+def discover_fonts():
+    """扫描一次字体目录，返回 {小写文件名（不含扩展名）: 路径}，先找到的优先"""
+    found = {}
+    # 程序目录与当前目录只看顶层，系统目录递归
+    shallow = set(font_dirs()[:3])
+    for d in font_dirs():
+        if not os.path.isdir(d):
+            continue
+        if d in shallow:
+            walker = [(d, [], os.listdir(d))]
+        else:
+            walker = os.walk(d)
+        for dirpath, _, filenames in walker:
+            for f in filenames:
+                stem, ext = os.path.splitext(f)
+                if ext.lower() in FONT_EXTS:
+                    found.setdefault(stem.lower(), os.path.join(dirpath, f))
+    return found
+
+
+def font_names():
+    """已发现字体的名称列表（供界面选择）"""
+    return sorted(discover_fonts())
+
+
+@functools.lru_cache(maxsize=1)
+def default_font():
+    """按默认优先级选择的字体文件路径，找不到返回 None（使用 Pillow 内置字体）"""
+    fonts = discover_fonts()
+    for candidate in PREFERRED_FONTS:
+        if candidate in fonts:
+            return fonts[candidate]
+    log.warning("未找到可用的 TrueType 字体，退回 Pillow 内置字体")
+    return None
+
+
+def resolve_font(name=None):
+    """字体名或路径 -> 字体文件路径；name 为空时按默认优先级选择
+
+    返回 None 表示使用 Pillow 内置字体。
+    """
+    if name == BUILTIN_FONT:
+        return None
+    if name:
+        if os.path.isfile(name):
+            return name
+        path = discover_fonts().get(os.path.splitext(name)[0].lower())
+        if path:
+            return path
+        log.warning("找不到字体 %s，使用默认字体", name)
+    return default_font()
+
+
+@functools.lru_cache(maxsize=64)
+def _load_font(path, size):
+    # ImageFont（FreeType）首次用到文字水印时才导入，图片水印与跳过的批处理不加载
+    from PIL import ImageFont
+
+    if path is None:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:  # Pillow < 10.1 的内置字体不能指定大小
+            return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+def get_font(size, name=None):
+    """按 (路径, 大小) 缓存的字体对象"""
+    return _load_font(resolve_font(name), size)
+
+
+# ---------- 文字位图 ----------
+@functools.lru_cache(maxsize=128)
+def _render_text(text, path, size, fill):
+    from PIL import ImageDraw
+
+    font = _load_font(path, size)
+    # 直接用字体测量，不再创建临时图片
+    left, top, right, bottom = font.getbbox(text)
+    # 为了更好的旋转不被裁切，创建稍大画布
+    pad = int(max(10, size * 0.4))
+    img = Image.new(
+        "RGBA", (right - left + pad * 2, bottom - top + pad * 2), (255, 255, 255, 0)
+    )
+    ImageDraw.Draw(img).text((pad - left, pad - top), text, font=font, fill=fill)
+    return img
+
+
+def render_text(text, size, fill=(255, 255, 255, 255), font=None):
+    """渲染文字水印基础图 (RGBA)
+
+    结果按 (文字, 字体, 大小, 颜色) 缓存，相同参数返回同一个图像对象
+    （也就能命中后续的水印渲染缓存），调用方不要原地修改。
+    """
+    return _render_text(text, resolve_font(font), size, tuple(fill))
+
+
+# ---------- 文字模板 ----------
+# 文字水印的描述：用到时才渲染；含模板占位符时按每张图片展开后再渲染
+TextSpec = collections.namedtuple("TextSpec", "text size fill font")
+
+
+class _Fields(dict):
+    def __missing__(self, key):
+        # 未知占位符原样保留
+        return "{" + key + "}"
+
+
+def text_context(path=None, index=1, size=None, on_disk=True):
+    """模板可用的字段：filename/stem/ext/index/date/mtime/width/height
+
+    path 不是本机文件（如上传时客户端给出的文件名）时 on_disk=False，
+    只取文件名，不访问文件系统，{mtime} 原样保留。
+    """
+    ctx = {"index": index, "date": datetime.date.today()}
+    if path:
+        filename = os.path.basename(path)
+        stem, ext = os.path.splitext(filename)
+        ctx.update(filename=filename, stem=stem, ext=ext.lstrip("."))
+    if path and on_disk:
+        try:
+            ctx["mtime"] = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+        except OSError:
+            pass
+    if size:
+        ctx.update(width=size[0], height=size[1])
+    return ctx
+
+
+def is_template(text):
+    return "{" in text
+
+
+def format_text(template, context):
+    """展开模板，如 "{stem} {date:%Y}"；格式错误时返回原文字"""
+    if not is_template(template):
+        return template
+    try:
+        return template.format_map(_Fields(context))
+    except (ValueError, IndexError, AttributeError, KeyError):
+        return template
+
+
+def clear_text_cache():
+    """清空字体与文字位图缓存（基准测试测量冷启动渲染时使用）"""
+    _load_font.cache_clear()
+    _render_text.cache_clear()
+
+
+def render_spec(spec, context):
+    """按 context 展开 TextSpec 并渲染；展开结果相同的图片共用缓存的位图"""
+    return render_text(format_text(spec.text, context), spec.size, spec.fill, spec.font)
@@ -0,0 +1,1669 @@
+"""Watermark Pro 图形界面（tkinter），由 watermark.py 在无子命令时加载"""
+import tkinter as tk
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from PIL import Image, ImageTk
+import contextlib
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from wm_core import (
+    Layer,
+    StagedRenderer,
+    avif_supported,
+    composite_tiles,
+    create_text_image,
+    load_watermark_image,
+    open_image,
+    open_preview,
+    point_in_rotated_rect,
+    rotated_size,
+    scaled_size,
+    tile_layout,
+)
+from wm_fonts import (
+    TextSpec,
+    font_names,
+    format_text,
+    is_template,
+    render_spec,
+    text_context,
+)
+from wm_job import (
+    image_watermark,
+    job_layers,
+    job_params,
+    job_watermark,
+    layered_job,
+    list_presets,
+    load_job,
+    load_preset,
+    make_job,
+    save_job,
+    save_preset,
+    text_watermark,
+)
+from wm_profile import enabled as profiling_enabled
+from wm_profile import recording, stage
+from wm_save import SaveQueue, SaveTask
+from wm_session import ImageCache, Session, folder_images, image_bytes, load_thumbnail
+from wm_view import Pyramid, TileCache
+
+
+# ---------- 工具函数 ----------
+def pil_image_to_tk(img):
+    return ImageTk.PhotoImage(img)
+
+
+def enable_dpi_awareness():
+    """Windows 高 DPI 屏幕上声明按物理像素绘制，避免整窗被系统放大后发虚
+
+    需在创建 Tk 根窗口之前调用；其它平台无需处理。
+    """
+    if sys.platform != "win32":
+        return
+    import ctypes
+
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)  # 系统 DPI 感知
+    except (AttributeError, OSError):
+        try:
+            ctypes.windll.user32.SetProcessDPIAware()  # Windows 7
+        except (AttributeError, OSError):
+            pass
+
+
+# ---------- 图层 ----------
+class WatermarkLayer:
+    """图层栈中的一层水印：水印基础图、画布上的位置与参数，以及各自的预览渲染缓存"""
+
+    def __init__(self):
+        # 水印基础图（PIL），不包含用户 scale/rotate/alpha
+        self.wm_base = None  # watermark base image (RGBA) - 原始 logo 或文字渲染图
+        self.wm_base_size = (0, 0)
+        self.wm_source = None  # 水印来源描述（wm_job 格式），导出任务时使用
+        # 可视参数（用户控制）
+        self.wm_x = 50
+        self.wm_y = 50
+        self.wm_user_scale = 1.0
+        self.wm_rotation = 0.0  # degrees
+        self.wm_opacity = 0.6  # 0.0 - 1.0
+        self.tile = None  # 平铺参数 dict，未平铺时为 None
+        # 预览渲染：分阶段缓存，每层一份，调整一层不会使其它层重新渲染
+        self.preview = StagedRenderer()
+        self.canvas_wm_id = None
+        self.wm_disp = None  # 当前 canvas 上水印对应的 PIL 图
+        self.wm_disp_tk = None
+        self._wm_render = None  # 未裁剪的水印预览渲染图
+        self._view_center = None  # (原图坐标的水印中心, 当时的水印位置与参数)
+
+    def label(self):
+        source = self.wm_source
+        if source is None:
+            return "（空）"
+        if source["type"] == "text":
+            return "文字：" + source["text"]
+        return "图片：" + os.path.basename(source["path"])
+
+
+def _layer_attr(name):
+    """应用上的同名属性读写当前图层（self.layer）的属性"""
+    return property(
+        lambda self: getattr(self.layer, name),
+        lambda self, value: setattr(self.layer, name, value),
+    )
+
+
+# ---------- 主应用 ----------
+class WatermarkProApp:
+    # 画布初始尺寸；之后按 <Configure> 事件跟随窗口大小
+    CANVAS_W = 900
+    CANVAS_H = 600
+    RESIZE_DEBOUNCE_MS = 80
+    # 视图缩放：滚轮每格的倍数、最大放大倍数与视口瓦片缓存上限
+    ZOOM_STEP = 1.25
+    MAX_ZOOM = 8.0
+    TILE_CACHE_BYTES = 96 * 1024 * 1024
+    # 滑块回调合并间隔与停止交互后补高质量渲染的延迟（毫秒）
+    PREVIEW_COALESCE_MS = 15
+    PREVIEW_SETTLE_MS = 200
+    SAVE_POLL_MS = 100
+    # 界面显示名 -> wm_core.ENCODER_PROFILES 中的编码配置
+    PROFILE_NAMES = {"快速": "fast", "默认": "default", "体积小": "small"}
+    # 文件夹会话：缩略图条、显示图缓存上限与预取范围
+    THUMB_SIZE = 72
+    THUMB_RADIUS = 5
+    DISPLAY_CACHE_BYTES = 256 * 1024 * 1024
+    THUMB_CACHE_BYTES = 32 * 1024 * 1024
+    PREFETCH_RADIUS = 2
+    DEFAULT_FONT = "默认"
+
+    # 单个水印的状态都属于当前图层；界面控件对应当前选中的图层
+    wm_base = _layer_attr("wm_base")
+    wm_base_size = _layer_attr("wm_base_size")
+    wm_source = _layer_attr("wm_source")
+    wm_x = _layer_attr("wm_x")
+    wm_y = _layer_attr("wm_y")
+    wm_user_scale = _layer_attr("wm_user_scale")
+    wm_rotation = _layer_attr("wm_rotation")
+    wm_opacity = _layer_attr("wm_opacity")
+    preview = _layer_attr("preview")
+    canvas_wm_id = _layer_attr("canvas_wm_id")
+    wm_disp = _layer_attr("wm_disp")
+    wm_disp_tk = _layer_attr("wm_disp_tk")
+    _wm_render = _layer_attr("_wm_render")
+    _view_center = _layer_attr("_view_center")
+
+    def __init__(self, root):
+        self.root = root
+        root.title("Watermark Pro — 文字/图片水印（可拖拽/缩放/旋转）")
+        # 图层栈（从下到上）；active 为界面上选中的层，layer 为正在处理的层
+        # （绘制全部图层时临时切换，见 using_layer）
+        self.layers = [WatermarkLayer()]
+        self.active = self.layer = self.layers[0]
+        self.setup_ui()
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 状态
+        self.base_path = None  # 原图路径
+        self.base_size = (0, 0)  # 原图尺寸（读文件头即可得到）
+        # 快速解码的缩小图（按屏幕尺寸，窗口最大化也够用）及其各级缩小图，仅用于显示
+        self.preview_max = (
+            max(self.CANVAS_W, root.winfo_screenwidth()),
+            max(self.CANVAS_H, root.winfo_screenheight()),
+        )
+        self.pyramid = None
+        self.tiles = TileCache(self.TILE_CACHE_BYTES)
+        self._full_poll_job = None
+        # 原始高分辨率图（PIL，RGB 或 RGBA）保存时才在后台解码，结果留在 Future 中
+        self._base_future = None
+        self._decoder = ThreadPoolExecutor(max_workers=1)
+        # 后台保存队列，进度由 poll_saves() 在主循环中轮询
+        self.saves = SaveQueue()
+        self._save_poll_job = None
+        # 文件夹会话（打开文件夹时创建）与显示图/缩略图缓存
+        self.session = None
+        self.display_cache = ImageCache(
+            lambda p: open_preview(p, self.preview_max),
+            self.DISPLAY_CACHE_BYTES,
+            sizeof=lambda item: image_bytes(item[0]),
+        )
+        self.thumb_cache = ImageCache(
+            lambda p: load_thumbnail(p, (self.THUMB_SIZE, self.THUMB_SIZE)),
+            self.THUMB_CACHE_BYTES,
+        )
+        self.thumb_tks = []
+        self._thumb_job = None
+        self.display_img = None  # 画布上可见部分的显示图（PIL）
+        self.display_tk = None  # 展示用 PhotoImage
+        self.display_scale = 1.0  # 视图缩放：原图像素 -> 画布像素
+        self.display_offset = (0, 0)  # 原图左上角在 canvas 上的坐标（放大后可为负）
+        self._fit_view = True  # 是否为“适应窗口”视图（窗口大小变化时重新适应）
+        self._layout_size = None  # 上次布局时的画布尺寸
+        self._resize_job = None
+        self._view_job = None
+
+        # 平铺滑块的当前值（tile_var 勾选时写入当前图层）
+        self.tile_spacing = 0.5  # 间距，相对水印尺寸
+        self.tile_stagger = 0.5  # 相邻行错开的比例
+        self.tile_angle = 0.0  # 行方向角度（不跟随旋转时使用）
+
+        # Canvas 元素 id（各层水印的元素 id 在图层上）
+        self.canvas_img_id = None
+
+        # 预览渲染：after() 合并回调；记下交互过的图层，停止后为它们补高质量渲染
+        self._fast_job = None
+        self._settle_job = None
+        self._preview_layers = []
+
+        # 拖拽相关（拖动水印，或在水印外拖动以平移视图）
+        self.dragging = False
+        self.panning = False
+        self.drag_start = (0, 0)
+
+    # ---------- UI 创建 ----------
+    def setup_ui(self):
+        # 顶部控制栏
+        top = tk.Frame(self.root)
+        top.pack(side="top", fill="x", padx=6, pady=6)
+
+        tk.Button(top, text="打开图片", command=self.open_base_image).pack(
+            side="left", padx=4
+        )
+        tk.Button(top, text="打开文件夹", command=self.open_folder).pack(
+            side="left", padx=4
+        )
+        tk.Button(
+            top, text="保存最终图片", command=self.save_result, bg="#b3e6b3"
+        ).pack(side="left", padx=4)
+        tk.Button(top, text="取消保存", command=self.cancel_save).pack(
+            side="left", padx=4
+        )
+
+        tk.Button(top, text="居中水印", command=self.center_watermark).pack(
+            side="left", padx=6
+        )
+        tk.Button(top, text="重置水印参数", command=self.reset_wm_params).pack(
+            side="left", padx=6
+        )
+        tk.Button(top, text="适应窗口", command=self.fit_view).pack(
+            side="left", padx=(12, 2)
+        )
+        tk.Button(top, text="1:1", command=lambda: self.zoom_view(1.0)).pack(
+            side="left", padx=2
+        )
+
+        # 任务与预设：与分辨率无关的水印参数，可用于批处理
+        tk.Button(top, text="导出任务", command=self.export_job).pack(
+            side="left", padx=(18, 4)
+        )
+        tk.Button(top, text="导入任务", command=self.import_job).pack(
+            side="left", padx=4
+        )
+        tk.Label(top, text="预设").pack(side="left", padx=(12, 2))
+        self.preset_var = tk.StringVar()
+        self.preset_combo = ttk.Combobox(
+            top,
+            textvariable=self.preset_var,
+            width=14,
+            state="readonly",
+            postcommand=self.fill_preset_list,
+        )
+        self.preset_combo.bind("<<ComboboxSelected>>", self.on_preset_selected)
+        self.preset_combo.pack(side="left")
+        tk.Button(top, text="存为预设", command=self.save_as_preset).pack(
+            side="left", padx=4
+        )
+
+        # 左侧控制面板
+        left = tk.Frame(self.root)
+        left.pack(side="left", fill="y", padx=6, pady=6)
+
+        # 图层栈：列表中上面的层盖在下面的层之上；下方控件调整选中的层
+        tk.Label(left, text="图层（上层在前）").pack(anchor="w")
+        self.layer_list = tk.Listbox(left, height=4, width=26, exportselection=False)
+        self.layer_list.pack(anchor="w")
+        self.layer_list.bind("<<ListboxSelect>>", self.on_layer_select)
+        layer_buttons = tk.Frame(left)
+        layer_buttons.pack(anchor="w", pady=(2, 0))
+        tk.Button(layer_buttons, text="添加", command=self.add_layer).pack(side="left")
+        tk.Button(layer_buttons, text="删除", command=self.remove_layer).pack(
+            side="left", padx=2
+        )
+        tk.Button(
+            layer_buttons, text="上移", command=lambda: self.move_layer(1)
+        ).pack(side="left", padx=2)
+        tk.Button(
+            layer_buttons, text="下移", command=lambda: self.move_layer(-1)
+        ).pack(side="left")
+        self.refresh_layer_list()
+        ttk.Separator(left, orient="horizontal").pack(fill="x", pady=8)
+
+        # 水印类型选择
+        tk.Label(left, text="水印类型").pack(anchor="w")
+        self.wm_type = tk.StringVar(value="text")
+        tk.Radiobutton(
+            left,
+            text="文字水印",
+            variable=self.wm_type,
+            value="text",
+            command=self.on_wm_type_change,
+        ).pack(anchor="w")
+        tk.Radiobutton(
+            left,
+            text="图片水印",
+            variable=self.wm_type,
+            value="image",
+            command=self.on_wm_type_change,
+        ).pack(anchor="w")
+
+        # 文字输入
+        tk.Label(left, text="文字内容").pack(anchor="w", pady=(8, 0))
+        self.text_entry = tk.Entry(left, width=24)
+        self.text_entry.insert(0, "© YourName")
+        self.text_entry.pack(anchor="w")
+        tk.Label(
+            left, text="可用 {filename} {stem} {date} {mtime:%Y-%m-%d}", fg="gray"
+        ).pack(anchor="w")
+
+        tk.Label(left, text="字体").pack(anchor="w", pady=(6, 0))
+        self.font_var = tk.StringVar(value=self.DEFAULT_FONT)
+        # 字体列表在第一次展开时才扫描系统字体目录
+        self.font_combo = ttk.Combobox(
+            left, textvariable=self.font_var, width=22, postcommand=self.fill_font_list
+        )
+        self.font_combo.pack(anchor="w")
+
+        tk.Label(left, text="字体大小（基准）").pack(anchor="w", pady=(6, 0))
+        self.font_size_var = tk.IntVar(value=72)
+        tk.Spinbox(
+            left, from_=8, to=400, increment=2, textvariable=self.font_size_var, width=8
+        ).pack(anchor="w")
+
+        tk.Button(left, text="生成文字水印", command=self.create_text_watermark).pack(
+            anchor="w", pady=6
+        )
+
+        # 图片水印选择
+        tk.Label(left, text="（图片水印）选择文件").pack(anchor="w", pady=(10, 0))
+        tk.Button(
+            left, text="选择水印图片（PNG 推荐）", command=self.select_watermark_image
+        ).pack(anchor="w", pady=4)
+        self.wm_image_label = tk.Label(left, text="未选择", fg="gray")
+        self.wm_image_label.pack(anchor="w")
+
+        # 分隔
+        ttk.Separator(left, orient="horizontal").pack(fill="x", pady=8)
+
+        # 参数滑块：缩放、透明度、旋转
+        tk.Label(left, text="缩放（鼠标滚轮也可）").pack(anchor="w")
+        self.scale_slider = tk.Scale(
+            left,
+            from_=0.1,
+            to=5.0,
+            resolution=0.05,
+            orient="horizontal",
+            length=180,
+            command=self.on_scale_change,
+        )
+        self.scale_slider.set(1.0)
+        self.scale_slider.pack(anchor="w")
+
+        tk.Label(left, text="透明度").pack(anchor="w", pady=(6, 0))
+        self.opacity_slider = tk.Scale(
+            left,
+            from_=0,
+            to=100,
+            orient="horizontal",
+            length=180,
+            command=self.on_opacity_change,
+        )
+        self.opacity_slider.set(60)
+        self.opacity_slider.pack(anchor="w")
+
+        tk.Label(left, text="旋转（度）").pack(anchor="w", pady=(6, 0))
+        self.rotate_slider = tk.Scale(
+            left,
+            from_=-180,
+            to=180,
+            orient="horizontal",
+            length=180,
+            command=self.on_rotate_change,
+        )
+        self.rotate_slider.set(0)
+        self.rotate_slider.pack(anchor="w")
+
+        # 平铺：同一水印按斜向格点重复铺满整图（防盗图）
+        ttk.Separator(left, orient="horizontal").pack(fill="x", pady=8)
+        self.tile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            left, text="平铺水印", variable=self.tile_var, command=self.on_tile_change
+        ).pack(anchor="w")
+        tk.Label(left, text="平铺间距（%）").pack(anchor="w")
+        self.tile_spacing_slider = tk.Scale(
+            left,
+            from_=0,
+            to=300,
+            orient="horizontal",
+            length=180,
+            command=self.on_tile_change,
+        )
+        self.tile_spacing_slider.set(50)
+        self.tile_spacing_slider.pack(anchor="w")
+        tk.Label(left, text="错行（%）").pack(anchor="w")
+        self.tile_stagger_slider = tk.Scale(
+            left,
+            from_=0,
+            to=100,
+            orient="horizontal",
+            length=180,
+            command=self.on_tile_change,
+        )
+        self.tile_stagger_slider.set(50)
+        self.tile_stagger_slider.pack(anchor="w")
+        tk.Label(left, text="平铺角度（度）").pack(anchor="w")
+        self.tile_follow_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            left,
+            text="跟随旋转",
+            variable=self.tile_follow_var,
+            command=self.on_tile_change,
+        ).pack(anchor="w")
+        self.tile_angle_slider = tk.Scale(
+            left,
+            from_=-180,
+            to=180,
+            orient="horizontal",
+            length=180,
+            command=self.on_tile_change,
+        )
+        self.tile_angle_slider.set(0)
+        self.tile_angle_slider.pack(anchor="w")
+
+        # 导出编码配置：快速 / 默认 / 体积小
+        ttk.Separator(left, orient="horizontal").pack(fill="x", pady=8)
+        tk.Label(left, text="导出编码").pack(anchor="w")
+        self.profile_var = tk.StringVar(value="默认")
+        ttk.Combobox(
+            left,
+            textvariable=self.profile_var,
+            values=list(self.PROFILE_NAMES),
+            state="readonly",
+            width=22,
+        ).pack(anchor="w")
+
+        self.timing_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            left, text="状态栏显示性能计时", variable=self.timing_var
+        ).pack(anchor="w", pady=(4, 0))
+
+        # 说明
+        ttk.Separator(left, orient="horizontal").pack(fill="x", pady=8)
+        tk.Label(left, text="操作提示：", fg="blue").pack(anchor="w")
+        tips = [
+            "左键在水印上按住并拖动移动（同时选中该层）",
+            "鼠标滚轮在水印上可放大/缩小",
+            "可用缩放/旋转/透明度滑块精调",
+            "生成/选择文字或图片水印后再拖动",
+        ]
+        for t in tips:
+            tk.Label(left, text="• " + t, anchor="w").pack(fill="x")
+
+        # 主画布（显示区）
+        right = tk.Frame(self.root)
+        right.pack(side="left", expand=True, fill="both", padx=6, pady=6)
+
+        # 缩略图条（打开文件夹后显示当前图片前后几张）
+        strip = tk.Frame(right)
+        strip.pack(side="top", fill="x", pady=(0, 6))
+        tk.Button(strip, text="◀", command=lambda: self.step_image(-1)).pack(
+            side="left"
+        )
+        tk.Button(strip, text="▶", command=lambda: self.step_image(1)).pack(
+            side="right"
+        )
+        self.thumb_canvas = tk.Canvas(
+            strip, height=self.THUMB_SIZE + 8, bg="#222222", highlightthickness=0
+        )
+        self.thumb_canvas.pack(side="left", expand=True, fill="x")
+        self.thumb_canvas.bind("<ButtonPress-1>", self.on_thumb_click)
+        self.root.bind("<Prior>", lambda e: self.step_image(-1))  # PageUp
+        self.root.bind("<Next>", lambda e: self.step_image(1))  # PageDown
+        self.canvas = tk.Canvas(
+            right, width=self.CANVAS_W, height=self.CANVAS_H, bg="#333333"
+        )
+        self.canvas.pack(expand=True, fill="both")
+
+        # 绑定交互事件
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+        self.canvas.bind("<ButtonPress-1>", self.on_canvas_press)
+        self.canvas.bind("<B1-Motion>", self.on_canvas_move)
+        self.canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)  # Windows
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)  # Linux scroll up
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)  # Linux scroll down
+        # Ctrl+滚轮始终缩放视图；中键拖动始终平移
+        self.canvas.bind("<Control-MouseWheel>", self.on_zoom_wheel)
+        self.canvas.bind("<Control-Button-4>", self.on_zoom_wheel)
+        self.canvas.bind("<Control-Button-5>", self.on_zoom_wheel)
+        self.canvas.bind("<ButtonPress-2>", self.on_pan_press)
+        self.canvas.bind("<B2-Motion>", self.on_canvas_move)
+        self.canvas.bind("<ButtonRelease-2>", self.on_canvas_release)
+
+        # 最下方状态栏
+        self.status_var = tk.StringVar(value="准备")
+        status = tk.Label(
+            self.root, textvariable=self.status_var, bd=1, relief="sunken", anchor="w"
+        )
+        status.pack(side="bottom", fill="x")
+
+    # ---------- 打开与显示基础图片 ----------
+    def open_base_image(self):
+        path = filedialog.askopenfilename(
+            filetypes=[("Images", "*.png;*.jpg;*.jpeg;*.bmp;*.tif")]
+        )
+        if not path:
+            return
+        with self.timed("打开"):
+            try:
+                # 只解码出显示所需的缩小图，原图等保存时再在后台解码
+                preview, size = open_preview(path, self.preview_max)
+            except Exception as e:
+                messagebox.showerror("错误", f"打开图片失败：{e}")
+                return
+            self.session = None
+            self.draw_thumbnails()
+            self.show_base(path, preview, size)
+            # reset watermark default
+            self.reset_wm_params()
+
+    def show_base(self, path, preview, size):
+        self.base_path = path
+        self.base_size = size
+        self.pyramid = Pyramid(preview, size)
+        self.tiles.clear()
+        self._base_future = None
+        if self._full_poll_job is not None:
+            self.root.after_cancel(self._full_poll_job)
+            self._full_poll_job = None
+        position = ""
+        if self.session is not None:
+            position = f"[{self.session.index + 1}/{len(self.session)}] "
+        self.status_var.set(
+            f"{position}已打开：{os.path.basename(path)}  尺寸：{size[0]}×{size[1]}"
+        )
+        # 生成 display image（等比缩放以适应 canvas）
+        self.update_display_image()
+
+    # ---------- 文件夹会话 ----------
+    def open_folder(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        paths = folder_images(folder)
+        if not paths:
+            messagebox.showwarning("提示", "文件夹中没有图片")
+            return
+        self.session = Session(paths)
+        self.show_session_image(0)
+
+    def remember_job(self):
+        """记下当前图片的水印任务（所有图层），切回这张图片时恢复"""
+        if self.session is None or self.base_path is None or not self.watermark_layers():
+            return None
+        job = self.layers_job()
+        self.session.jobs[self.base_path] = job
+        return job
+
+    def step_image(self, step):
+        if self.session is not None:
+            self.show_session_image(self.session.clamp(self.session.index + step))
+
+    def on_thumb_click(self, event):
+        if self.session is None:
+            return
+        slot = self.THUMB_SIZE + 8
+        d = round((event.x - self.thumb_center_x()) / slot)
+        if d and abs(d) <= self.THUMB_RADIUS:
+            self.show_session_image(self.session.clamp(self.session.index + d))
+
+    def show_session_image(self, index):
+        """切换到会话中的第 index 张：命中缓存时立即显示，否则后台解码完成后显示"""
+        job = self.remember_job()
+        self.session.index = index
+        path = self.session.current
+        # 没有单独调整过的图片沿用上一张的水印（位置按锚点与比例换算）
+        job = self.session.jobs.get(path, job)
+        future = self.display_cache.request(path)
+        # 当前图片优先，其后是前后几张；离开范围且未开始的预取被取消
+        self.display_cache.prefetch(
+            [path] + self.session.neighbours(self.PREFETCH_RADIUS)
+        )
+        self.draw_thumbnails()
+        if not future.done():
+            self.status_var.set(f"正在加载：{os.path.basename(path)}")
+        self._poll_session_image(future, path, job)
+
+    def _poll_session_image(self, future, path, job):
+        if self.session is None or self.session.current != path:
+            return  # 期间已切换到其它图片
+        if not future.done():
+            self.root.after(30, self._poll_session_image, future, path, job)
+            return
+        try:
+            preview, size = future.result()
+        except Exception as e:
+            self.status_var.set(f"打开图片失败：{os.path.basename(path)}：{e}")
+            return
+        self.show_base(path, preview, size)
+        if job is not None:
+            self.apply_job(job)
+        else:
+            self.reset_wm_params()
+
+    def thumb_center_x(self):
+        """缩略图条中当前图片所在格的中心"""
+        return max(self.thumb_canvas.winfo_width(), self.THUMB_SIZE + 8) // 2
+
+    def draw_thumbnails(self):
+        """只为当前图片附近的几张创建 PhotoImage；未就绪的缩略图稍后补画"""
+        if self._thumb_job is not None:
+            self.root.after_cancel(self._thumb_job)
+            self._thumb_job = None
+        self.thumb_canvas.delete("all")
+        self.thumb_tks = []
+        if self.session is None:
+            return
+        slot = self.THUMB_SIZE + 8
+        center_x = self.thumb_center_x()
+        missing = []
+        for d in range(-self.THUMB_RADIUS, self.THUMB_RADIUS + 1):
+            i = self.session.index + d
+            if not 0 <= i < len(self.session):
+                continue
+            path = self.session.paths[i]
+            x = center_x + d * slot
+            if d == 0:
+                self.thumb_canvas.create_rectangle(
+                    x - slot // 2 + 1,
+                    1,
+                    x + slot // 2 - 1,
+                    slot - 1,
+                    outline="#4da6ff",
+                    width=2,
+                )
+            thumb = self.thumb_cache.get(path)
+            if thumb is None:
+                missing.append(path)
+                continue
+            tk_img = pil_image_to_tk(thumb)
+            self.thumb_tks.append(tk_img)
+            self.thumb_canvas.create_image(x, slot // 2, image=tk_img)
+        if missing:
+            self.thumb_cache.prefetch(missing)
+            self._thumb_job = self.root.after(100, self.draw_thumbnails)
+
+    def canvas_size(self):
+        """画布的实际尺寸（尚未显示时用初始尺寸）"""
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w <= 1 or h <= 1:
+            return self.CANVAS_W, self.CANVAS_H
+        return w, h
+
+    def display_size(self):
+        """原图在画布上的显示尺寸"""
+        return self.pyramid.scaled_size(self.display_scale)
+
+    def fit_scale(self):
+        cw, ch = self.canvas_size()
+        bw, bh = self.base_size
+        return min(cw / bw, ch / bh, 1.0)
+
+    def update_display_image(self, wm_centers=None):
+        """适应窗口：按画布尺寸缩放并居中；wm_centers 为各层水印中心的原图坐标，给出时保持水印位置"""
+        if self.pyramid is None:
+            return
+        self._fit_view = True
+        cw, ch = self.canvas_size()
+        scale = self.fit_scale()
+        dw, dh = self.pyramid.scaled_size(scale)
+        # 放置在画布中居中
+        self.set_view(scale, ((cw - dw) // 2, (ch - dh) // 2), wm_centers)
+
+    def set_view(self, scale, offset, wm_centers=None):
+        self.display_scale = scale
+        self.display_offset = self.clamp_offset(scale, offset)
+        self._layout_size = self.canvas_size()
+        for layer, center in zip(self.layers, wm_centers or ()):
+            with self.using_layer(layer):
+                if center is not None:
+                    self.place_watermark(center)
+                    self._view_center = (center, self.wm_state())
+        self.render_view()
+
+    def clamp_offset(self, scale, offset):
+        """比画布小的方向居中，否则不让图片边缘离开画布"""
+        cw, ch = self.canvas_size()
+        dw, dh = self.pyramid.scaled_size(scale)
+
+        def clamp(o, d, c):
+            return (c - d) // 2 if d <= c else max(c - d, min(0, o))
+
+        return clamp(offset[0], dw, cw), clamp(offset[1], dh, ch)
+
+    def visible_rect(self):
+        """原图在画布上可见部分的矩形 (x0, y0, x1, y1)，画布坐标"""
+        cw, ch = self.canvas_size()
+        dx, dy = self.display_offset
+        dw, dh = self.display_size()
+        x0, y0 = max(0, dx), max(0, dy)
+        return x0, y0, max(x0 + 1, min(cw, dx + dw)), max(y0 + 1, min(ch, dy + dh))
+
+    def render_view(self):
+        """只为可见区域取瓦片拼出显示图；放大超过预览分辨率时在后台载入原图"""
+        self._view_job = None
+        if self.pyramid is None:
+            return
+        if self.display_scale > self.pyramid.max_scale:
+            self.request_full_resolution()
+        x0, y0, x1, y1 = self.visible_rect()
+        dx, dy = self.display_offset
+        with stage("视口") as st:
+            self.display_img = st.note(
+                self.tiles.render(
+                    self.pyramid, self.display_scale, (x0 - dx, y0 - dy, x1 - dx, y1 - dy)
+                )
+            )
+        with stage("PhotoImage"):
+            self.display_tk = pil_image_to_tk(self.display_img)
+        if self.canvas_img_id is None:
+            self.canvas_img_id = self.canvas.create_image(
+                x0, y0, anchor="nw", image=self.display_tk
+            )
+        else:
+            self.canvas.itemconfigure(self.canvas_img_id, image=self.display_tk)
+            self.canvas.coords(self.canvas_img_id, x0, y0)
+        # 重绘已有水印的各层
+        self.redraw_watermark_on_canvas(all_layers=True)
+
+    def schedule_view(self):
+        # 平移时事件很密集：画布元素先整体移动，合并后再补画新露出的区域
+        if self._view_job is None:
+            self._view_job = self.root.after(self.PREVIEW_COALESCE_MS, self.render_view)
+
+    def request_full_resolution(self):
+        if self.pyramid.full is not None or self._full_poll_job is not None:
+            return
+        self.status_var.set("正在载入原图以显示细节…")
+        # 视图单独解码一份原图：保存线程会把水印原地合成进 start_base_decode()
+        # 的结果并一直保持到编码结束，与视图共用会读到（并缓存）合成中的像素
+        future = self._decoder.submit(open_image, self.base_path)
+        self._poll_full_resolution(future, self.base_path)
+
+    def _poll_full_resolution(self, future, path):
+        self._full_poll_job = None
+        if path != self.base_path:
+            return
+        if not future.done():
+            self._full_poll_job = self.root.after(
+                50, self._poll_full_resolution, future, path
+            )
+            return
+        if future.exception() is not None:
+            self.status_var.set(f"载入原图失败：{future.exception()}")
+            return
+        self.pyramid.set_full(future.result())
+        self.status_var.set(f"视图：{self.display_scale * 100:.0f}%")
+        self.render_view()
+
+    def wm_state(self):
+        return (self.wm_x, self.wm_y, self.wm_user_scale, self.wm_rotation)
+
+    def view_wm_center(self):
+        """视图变化前水印中心在原图上的坐标
+
+        水印自上次视图变化后没动过时沿用原来的中心，反复缩放不累积取整误差。
+        """
+        if self._view_center is not None and self._view_center[1] == self.wm_state():
+            return self._view_center[0]
+        return self.wm_center_on_base()
+
+    def view_wm_centers(self):
+        """各层的 view_wm_center()，与 self.layers 一一对应"""
+        centers = []
+        for layer in self.layers:
+            with self.using_layer(layer):
+                centers.append(self.view_wm_center())
+        return centers
+
+    def zoom_view(self, scale, anchor=None):
+        """把视图缩放到 scale，anchor（画布坐标，默认画布中心）下的原图像素保持不动"""
+        if self.pyramid is None:
+            return
+        fit = self.fit_scale()
+        scale = max(min(fit, 1.0), min(self.MAX_ZOOM, scale))
+        if abs(scale - 1.0) < 0.03:
+            scale = 1.0
+        cw, ch = self.canvas_size()
+        ax, ay = anchor if anchor is not None else (cw // 2, ch // 2)
+        dx, dy = self.display_offset
+        s = self.display_scale
+        bx, by = (ax - dx) / s, (ay - dy) / s
+        with self.timed("缩放视图"):
+            if scale <= fit:
+                self.update_display_image(self.view_wm_centers())
+            else:
+                self._fit_view = False
+                offset = (int(round(ax - bx * scale)), int(round(ay - by * scale)))
+                self.set_view(scale, offset, self.view_wm_centers())
+        if not self.timing_var.get():
+            self.status_var.set(f"视图：{self.display_scale * 100:.0f}%")
+
+    def fit_view(self):
+        self.zoom_view(0.0)
+
+    def pan_view(self, ddx, ddy):
+        """平移视图；水印随原图一起移动"""
+        old = self.display_offset
+        new = self.clamp_offset(self.display_scale, (old[0] + ddx, old[1] + ddy))
+        ddx, ddy = new[0] - old[0], new[1] - old[1]
+        if not (ddx or ddy):
+            return
+        self.display_offset = new
+        if self.canvas_img_id is not None:
+            self.canvas.move(self.canvas_img_id, ddx, ddy)
+        for layer in self.layers:
+            layer.wm_x += ddx
+            layer.wm_y += ddy
+            if layer.canvas_wm_id is not None:
+                self.canvas.move(layer.canvas_wm_id, ddx, ddy)
+        self.schedule_view()
+
+    def on_canvas_configure(self, event):
+        # 拖动窗口边框时事件很密集，停下后再重新布局
+        if self._resize_job is not None:
+            self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(
+            self.RESIZE_DEBOUNCE_MS, self._apply_canvas_resize
+        )
+
+    def _apply_canvas_resize(self):
+        self._resize_job = None
+        if self.pyramid is None or self.canvas_size() == self._layout_size:
+            return
+        centers = self.view_wm_centers()
+        with self.timed("重新布局"):
+            if self._fit_view:
+                self.update_display_image(centers)
+                return
+            # 放大查看时保持缩放倍数，画布中心对准的位置不变
+            ow, oh = self._layout_size
+            cw, ch = self.canvas_size()
+            dx, dy = self.display_offset
+            self.set_view(
+                self.display_scale, (dx + (cw - ow) // 2, dy + (ch - oh) // 2), centers
+            )
+
+    # ---------- 图层栈 ----------
+    @contextlib.contextmanager
+    def using_layer(self, layer):
+        """块内以 layer 为当前图层（wm_x、tile_spec() 等都指向它）"""
+        current = self.layer
+        self.layer = layer
+        try:
+            yield layer
+        finally:
+            self.layer = current
+
+    def watermark_layers(self):
+        """已有水印的图层（从下到上）"""
+        return [layer for layer in self.layers if layer.wm_base is not None]
+
+    def select_layer(self, layer):
+        self.active = self.layer = layer
+        self.show_layer_controls()
+        self.refresh_layer_list()
+
+    def show_layer_controls(self):
+        """把当前图层的水印来源与参数显示到左侧控件上"""
+        if self.wm_source is not None:
+            self.show_source(self.wm_source)
+        else:
+            self.wm_image_label.config(text="未选择")
+        self.scale_slider.set(self.wm_user_scale)
+        self.rotate_slider.set(self.wm_rotation)
+        self.opacity_slider.set(int(round(self.wm_opacity * 100)))
+        self.show_tile_controls(self.layer.tile)
+
+    def show_source(self, source):
+        if source["type"] == "text":
+            self.wm_type.set("text")
+            self.text_entry.delete(0, "end")
+            self.text_entry.insert(0, source["text"])
+            self.font_size_var.set(source["font_size"])
+            self.font_var.set(source["font"] or self.DEFAULT_FONT)
+        else:
+            self.wm_type.set("image")
+            self.wm_image_label.config(text=os.path.basename(source["path"]))
+
+    def refresh_layer_list(self):
+        self.layer_list.delete(0, "end")
+        for layer in reversed(self.layers):
+            self.layer_list.insert("end", layer.label())
+        self.layer_list.selection_set(len(self.layers) - 1 - self.layers.index(self.active))
+
+    def on_layer_select(self, event=None):
+        selection = self.layer_list.curselection()
+        if not selection:
+            return
+        layer = self.layers[len(self.layers) - 1 - int(selection[0])]
+        if layer is not self.active:
+            self.select_layer(layer)
+
+    def add_layer(self):
+        """在最上面添加一个空图层并选中；之后生成文字或选择图片作为它的水印"""
+        layer = WatermarkLayer()
+        self.layers.append(layer)
+        self.select_layer(layer)
+        self.status_var.set("已添加图层：请生成文字水印或选择水印图片")
+
+    def remove_layer(self):
+        index = self.layers.index(self.active)
+        self.discard_layer(self.active)
+        del self.layers[index]
+        if not self.layers:
+            self.layers.append(WatermarkLayer())
+        self.select_layer(self.layers[max(0, index - 1)])
+        self.status_var.set("已删除图层")
+
+    def discard_layer(self, layer):
+        if layer.canvas_wm_id:
+            self.canvas.delete(layer.canvas_wm_id)
+            layer.canvas_wm_id = None
+        if layer in self._preview_layers:
+            self._preview_layers.remove(layer)
+
+    def move_layer(self, step):
+        """step=1 上移一层，-1 下移一层"""
+        i = self.layers.index(self.active)
+        j = i + step
+        if not 0 <= j < len(self.layers):
+            return
+        self.layers[i], self.layers[j] = self.layers[j], self.layers[i]
+        self.restack_layers()
+        self.refresh_layer_list()
+
+    # ---------- 创建/选择水印 ----------
+    def create_text_watermark(self):
+        text = self.text_entry.get().strip()
+        if not text:
+            messagebox.showwarning("提示", "请输入水印文字")
+            return
+        # 创建一张带透明背景的文字图片（基准大小：字体大小直接使用用户输入）
+        font_size = max(8, int(self.font_size_var.get()))
+        font = self.font_var.get().strip()
+        font = None if font in ("", self.DEFAULT_FONT) else font
+        # 白色半透明默认颜色，可扩展为颜色选择
+        fill = (255, 255, 255, int(255 * self.wm_opacity))
+        # 模板按当前底图展开（批处理时则按每张图片展开）
+        wm_img = create_text_image(
+            format_text(text, self.text_context()),
+            font_size,
+            fill=fill,
+            font=font,
+        )
+        self.set_wm_base(wm_img)
+        self.wm_source = text_watermark(text, font_size, font, fill)
+        self.refresh_layer_list()
+        self.status_var.set("已生成文字水印（可拖动/缩放/旋转）")
+
+    def text_context(self):
+        """文字模板字段：当前图片的文件名、尺寸，会话中的序号"""
+        index = self.session.index + 1 if self.session is not None else 1
+        return text_context(self.base_path, index, self.base_size)
+
+    def fill_font_list(self):
+        if not self.font_combo["values"]:
+            self.font_combo["values"] = [self.DEFAULT_FONT] + font_names()
+
+    def select_watermark_image(self):
+        path = filedialog.askopenfilename(
+            filetypes=[("Images", "*.png;*.jpg;*.jpeg;*.bmp")]
+        )
+        if not path:
+            return
+        try:
+            # 将 alpha channel 强制存在（确保有透明通道）
+            wm = load_watermark_image(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"打开水印图片失败：{e}")
+            return
+        self.set_wm_base(wm)
+        self.wm_source = image_watermark(path)
+        self.refresh_layer_list()
+        self.wm_image_label.config(text=os.path.basename(path))
+        self.wm_type.set("image")
+        self.status_var.set(f"已选择水印图片：{os.path.basename(path)}")
+
+    def set_wm_base(self, wm_img):
+        self.wm_base = wm_img.copy()
+        self.wm_base_size = self.wm_base.size
+        # 初始化位置：图像左上 50,50（显示坐标）
+        # 若已经有 display img，放在中心
+        if self.display_img:
+            # 放大查看时放在可见区域中心
+            x0, y0, x1, y1 = self.visible_rect()
+            self.wm_x = (
+                (x0 + x1) // 2 - int((self.wm_base_size[0] * self.display_scale) / 2)
+            )
+            self.wm_y = (
+                (y0 + y1) // 2 - int((self.wm_base_size[1] * self.display_scale) / 2)
+            )
+        else:
+            self.wm_x, self.wm_y = 50, 50
+        self.wm_user_scale = 1.0
+        self.scale_slider.set(1.0)
+        self.rotate_slider.set(0)
+        # 重绘
+        self.redraw_watermark_on_canvas()
+
+    # ---------- 重绘水印到 Canvas（仅预览） ----------
+    def get_wm_render_for_canvas(self, fast=False):
+        """基于 wm_base 与用户参数，生成展示用 watermark (PIL)"""
+        if self.wm_base is None:
+            return None
+        # 直接使用 combined scale = user_scale * display_scale 来避免多次插值
+        return self.preview.render(
+            self.wm_base,
+            self.wm_preview_scale(),
+            self.wm_rotation,
+            self.wm_opacity,
+            fast=fast,
+        )
+
+    def view_magnify(self):
+        """视图超过 1:1 时水印按原图像素渲染，再随视图按像素放大"""
+        return max(1.0, self.display_scale)
+
+    def wm_preview_scale(self):
+        return self.wm_user_scale * self.display_scale / self.view_magnify()
+
+    def wm_scaled_size(self):
+        """水印在画布上未旋转时的尺寸"""
+        return scaled_size(self.wm_base_size, self.wm_user_scale * self.display_scale)
+
+    def wm_render_size(self):
+        """画布上水印渲染图（旋转后外接矩形）的尺寸，按公式计算而不实际渲染"""
+        # 与 StagedRenderer 一样把角度取整到 0.1 度
+        return rotated_size(self.wm_scaled_size(), round(self.wm_rotation, 1))
+
+    def hit_watermark(self, x, y):
+        """(x, y) 是否落在旋转后的水印矩形内（平铺时整张图都算）"""
+        if self.wm_base is None or self.display_img is None:
+            return False
+        if self.tile_spec() is not None:
+            x0, y0, x1, y1 = self.visible_rect()
+            return x0 <= x <= x1 and y0 <= y <= y1
+        w, h = self.wm_render_size()
+        center = (self.wm_x + w / 2.0, self.wm_y + h / 2.0)
+        return point_in_rotated_rect(
+            (x, y), center, self.wm_scaled_size(), self.wm_rotation
+        )
+
+    def redraw_watermark_on_canvas(self, fast=False, all_layers=False):
+        """重绘当前图层的水印；all_layers=True 时（视图变化）重绘所有图层"""
+        with self.timed("预览"):
+            if not all_layers:
+                self._redraw_watermark(fast)
+                return
+            for layer in self.layers:
+                with self.using_layer(layer):
+                    self._redraw_watermark(fast)
+
+    def _redraw_watermark(self, fast):
+        if self.wm_base is None or self.display_img is None:
+            # 没有水印时清除旧的 wm
+            if self.canvas_wm_id:
+                self.canvas.delete(self.canvas_wm_id)
+                self.canvas_wm_id = None
+            return
+        wm_disp = self.get_wm_render_for_canvas(fast=fast)
+        if wm_disp is None:
+            return
+        tile = self.tile_spec()
+        if tile is not None:
+            wm_disp = self.render_tile_overlay(wm_disp, tile)
+        self._wm_render = wm_disp
+        x, y = self.watermark_item_pos()
+        wm_disp, x, y = self.clip_to_canvas(wm_disp, x, y)
+        if wm_disp is None:
+            # 水印完全在画布之外
+            if self.canvas_wm_id:
+                self.canvas.delete(self.canvas_wm_id)
+                self.canvas_wm_id = None
+            self.wm_disp = None
+            return
+        # 渲染结果未变（如只是移动位置）时复用已有 PhotoImage
+        if wm_disp is not self.wm_disp or self.wm_disp_tk is None:
+            self.wm_disp = wm_disp
+            with stage("PhotoImage"):
+                self.wm_disp_tk = pil_image_to_tk(wm_disp)
+            if self.canvas_wm_id:
+                self.canvas.itemconfigure(self.canvas_wm_id, image=self.wm_disp_tk)
+        if self.canvas_wm_id:
+            self.canvas.coords(self.canvas_wm_id, x, y)
+            return
+        # 直接在 canvas 的 wm_x, wm_y 位置绘制（wm_x/wm_y 为 display 坐标）
+        self.canvas_wm_id = self.canvas.create_image(
+            x, y, anchor="nw", image=self.wm_disp_tk
+        )
+        # 把水印放到图片之上，并按图层顺序排列
+        self.restack_layers()
+
+    def restack_layers(self):
+        for layer in self.layers:
+            if layer.canvas_wm_id:
+                self.canvas.tag_raise(layer.canvas_wm_id)
+
+    def watermark_item_pos(self):
+        # 平铺时整层覆盖可见区域，否则水印左上角在 (wm_x, wm_y)
+        if self.tile_spec() is not None:
+            return self.visible_rect()[:2]
+        return self.wm_x, self.wm_y
+
+    def render_tile_overlay(self, wm_disp, tile):
+        """把水印按平铺格点铺成覆盖可见区域的透明层（水印渲染的分辨率）
+
+        格点只与水印中心有关，以可见区域左上角为原点计算即可只得到可见的水印，
+        放大查看大图时也不会生成整图大小的图层。
+        """
+        x0, y0, x1, y1 = self.visible_rect()
+        m = self.view_magnify()
+        w, h = self.wm_render_size()
+        center = (
+            (self.wm_x + w // 2 - x0) / m,
+            (self.wm_y + h // 2 - y0) / m,
+        )
+        size = (
+            max(1, int(math.ceil((x1 - x0) / m))),
+            max(1, int(math.ceil((y1 - y0) / m))),
+        )
+        positions = tile_layout(
+            size,
+            self.wm_base_size,
+            center,
+            self.wm_preview_scale(),
+            self.wm_rotation,
+            tile,
+            wm_disp.size,
+        )
+        overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+        composite_tiles(overlay, wm_disp, positions)
+        return overlay
+
+    def clip_to_canvas(self, img, x, y):
+        """水印层在画布上可见的部分，返回 (图, x, y)；完全不可见时图为 None
+
+        视图超过 1:1 时按像素放大。完全在画布内且无需放大时原样返回，
+        拖动时可以直接移动已有的画布元素。
+        """
+        m = self.view_magnify()
+        cw, ch = self.canvas_size()
+        w, h = int(round(img.width * m)), int(round(img.height * m))
+        if m == 1.0 and x >= 0 and y >= 0 and x + w <= cw and y + h <= ch:
+            return img, x, y
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(cw, x + w), min(ch, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return None, x, y
+        box = ((x0 - x) / m, (y0 - y) / m, (x1 - x) / m, (y1 - y) / m)
+        with stage("裁剪水印") as st:
+            img = st.note(img.resize((x1 - x0, y1 - y0), Image.NEAREST, box=box))
+        return img, x0, y0
+
+    def move_watermark_item(self):
+        w, h = self.wm_render_size()
+        cw, ch = self.canvas_size()
+        inside = (
+            self.wm_x >= 0
+            and self.wm_y >= 0
+            and self.wm_x + w <= cw
+            and self.wm_y + h <= ch
+        )
+        # 拖动只移动已有的 canvas 元素，不重新渲染
+        if (
+            self.tile_spec() is None
+            and self.canvas_wm_id
+            and inside
+            and self.wm_disp is not None
+            and self.wm_disp is self._wm_render
+        ):
+            self.canvas.coords(self.canvas_wm_id, self.wm_x, self.wm_y)
+            return
+        # 平铺时拖动改变格点原点、水印跨出画布或视图已放大时需要重新裁剪；
+        # 单个水印的渲染已缓存，只需在可见区域上重铺/裁剪
+        self.redraw_watermark_on_canvas()
+
+    def schedule_preview(self):
+        """滑块/滚轮交互：合并密集回调先做快速预览，停止后补一次高质量渲染"""
+        if self.layer not in self._preview_layers:
+            self._preview_layers.append(self.layer)
+        if self._fast_job is None:
+            self._fast_job = self.root.after(
+                self.PREVIEW_COALESCE_MS, self._run_fast_preview
+            )
+        if self._settle_job is not None:
+            self.root.after_cancel(self._settle_job)
+        self._settle_job = self.root.after(
+            self.PREVIEW_SETTLE_MS, self._run_settled_preview
+        )
+
+    def _run_fast_preview(self):
+        self._fast_job = None
+        for layer in self._preview_layers:
+            with self.using_layer(layer):
+                self.redraw_watermark_on_canvas(fast=True)
+
+    def _run_settled_preview(self):
+        self._settle_job = None
+        layers, self._preview_layers = self._preview_layers, []
+        for layer in layers:
+            with self.using_layer(layer):
+                self.redraw_watermark_on_canvas()
+
+    # ---------- 交互事件（拖动、缩放） ----------
+    def on_canvas_press(self, event):
+        # 点击判断是否在水印范围内（旋转后的矩形，不需要渲染）；水印外拖动平移视图
+        if self.display_img is None:
+            return
+        x, y = event.x, event.y
+        layer = self.layer_at(x, y)
+        if layer is not None:
+            if layer is not self.active:
+                self.select_layer(layer)
+            self.dragging = True
+            self.drag_start = (x, y)
+            self.status_var.set("拖动水印中...")
+        else:
+            self.dragging = False
+            self.on_pan_press(event)
+
+    def layer_at(self, x, y):
+        """(x, y) 处最上面的水印图层；平铺层覆盖整图，只在没有命中单个水印时才选中"""
+        candidates = sorted(reversed(self.layers), key=lambda l: l.tile is not None)
+        for layer in candidates:
+            if layer.wm_base is None:
+                continue
+            with self.using_layer(layer):
+                if self.hit_watermark(x, y):
+                    return layer
+        return None
+
+    def on_pan_press(self, event):
+        if self.display_img is None:
+            return
+        self.panning = True
+        self.drag_start = (event.x, event.y)
+
+    def on_canvas_move(self, event):
+        if self.panning:
+            x, y = event.x, event.y
+            self.pan_view(x - self.drag_start[0], y - self.drag_start[1])
+            self.drag_start = (x, y)
+            return
+        if not self.dragging:
+            return
+        x, y = event.x, event.y
+        dx = x - self.drag_start[0]
+        dy = y - self.drag_start[1]
+        self.wm_x += dx
+        self.wm_y += dy
+        self.drag_start = (x, y)
+        self.move_watermark_item()
+
+    def on_canvas_release(self, event):
+        self.panning = False
+        if self.dragging:
+            self.dragging = False
+            self.status_var.set("移动完成")
+
+    @staticmethod
+    def wheel_delta(event):
+        # Determine scroll direction cross-platform
+        if getattr(event, "num", None) == 4:
+            return 120
+        if getattr(event, "num", None) == 5:
+            return -120
+        return getattr(event, "delta", 0)
+
+    def on_zoom_wheel(self, event):
+        if self.display_img is None:
+            return
+        delta = self.wheel_delta(event)
+        if delta:
+            factor = self.ZOOM_STEP if delta > 0 else 1.0 / self.ZOOM_STEP
+            self.zoom_view(self.display_scale * factor, (event.x, event.y))
+
+    def on_mouse_wheel(self, event):
+        # 鼠标滚轮在水印上时缩放该层水印（检测光标是否在水印范围），否则缩放视图
+        if self.display_img is None:
+            return
+        layer = self.layer_at(event.x, event.y)
+        if layer is None:
+            self.on_zoom_wheel(event)
+            return
+        if layer is not self.active:
+            self.select_layer(layer)
+        delta = self.wheel_delta(event)
+        # 缩放比例变化
+        factor = 1.0 + (0.12 if delta > 0 else -0.12)
+        new_scale = max(0.05, min(10.0, self.wm_user_scale * factor))
+        self.wm_user_scale = new_scale
+        self.scale_slider.set(self.wm_user_scale)
+        self.schedule_preview()
+        self.status_var.set(f"缩放：{self.wm_user_scale:.2f}x")
+
+    # ---------- 滑块回调 ----------
+    def on_scale_change(self, val):
+        try:
+            self.wm_user_scale = float(val)
+        except:
+            return
+        self.schedule_preview()
+
+    def on_opacity_change(self, val):
+        try:
+            v = int(val)
+            self.wm_opacity = max(0.0, min(1.0, v / 100.0))
+        except:
+            return
+        self.schedule_preview()
+
+    def on_rotate_change(self, val):
+        try:
+            self.wm_rotation = float(val)
+        except:
+            return
+        self.schedule_preview()
+
+    def on_tile_change(self, val=None):
+        try:
+            self.tile_spacing = float(self.tile_spacing_slider.get()) / 100.0
+            self.tile_stagger = float(self.tile_stagger_slider.get()) / 100.0
+            self.tile_angle = float(self.tile_angle_slider.get())
+        except:
+            return
+        self.active.tile = self.tile_from_controls()
+        self.schedule_preview()
+
+    def tile_from_controls(self):
+        if not self.tile_var.get():
+            return None
+        return {
+            "spacing": self.tile_spacing,
+            "stagger": self.tile_stagger,
+            "angle": None if self.tile_follow_var.get() else self.tile_angle,
+        }
+
+    def tile_spec(self):
+        """当前图层的平铺参数 dict，未开启平铺时为 None"""
+        return self.layer.tile
+
+    def show_tile_controls(self, tile):
+        self.tile_var.set(tile is not None)
+        if tile is not None:
+            self.tile_spacing_slider.set(int(round(tile["spacing"] * 100)))
+            self.tile_stagger_slider.set(int(round(tile["stagger"] * 100)))
+            self.tile_follow_var.set(tile["angle"] is None)
+            if tile["angle"] is not None:
+                self.tile_angle_slider.set(tile["angle"])
+
+    # ---------- 操作按钮 ----------
+    def center_watermark(self):
+        if not self.display_img or not self.wm_base:
+            return
+        dx, dy = self.display_offset
+        dw, dh = self.display_size()
+        ww, wh = self.wm_render_size()
+        self.wm_x = dx + (dw - ww) // 2
+        self.wm_y = dy + (dh - wh) // 2
+        self.redraw_watermark_on_canvas()
+
+    def reset_wm_params(self):
+        self.wm_user_scale = 1.0
+        self.wm_rotation = 0.0
+        self.wm_opacity = 0.6
+        self.scale_slider.set(1.0)
+        self.rotate_slider.set(0)
+        self.opacity_slider.set(int(self.wm_opacity * 100))
+        self.status_var.set("水印参数已重置")
+        self.redraw_watermark_on_canvas()
+
+    def on_wm_type_change(self):
+        # 切换到文字时可以自动生成文字水印（保持上次文字）
+        if self.wm_type.get() == "text":
+            self.create_text_watermark()
+        # 如果切到图片没有选择，则提示
+        else:
+            if self.wm_base is None:
+                self.status_var.set("请选择水印图片或生成文字水印")
+
+    # ---------- 任务与预设 ----------
+    def current_job(self):
+        """当前水印的任务描述（位置按九宫格锚点 + 相对偏移记录）"""
+        if self.base_path is None or not self.watermark_layers():
+            messagebox.showwarning("提示", "请先打开图片并生成/选择水印")
+            return None
+        return self.layers_job()
+
+    def layers_job(self):
+        """各层水印的任务描述；只有一层时为单层格式"""
+        jobs = []
+        for layer in self.watermark_layers():
+            with self.using_layer(layer):
+                jobs.append(
+                    make_job(
+                        self.wm_source,
+                        self.base_size,
+                        self.wm_base_size,
+                        self.wm_center_on_base(),
+                        self.wm_user_scale,
+                        self.wm_rotation,
+                        self.wm_opacity,
+                        self.tile_spec(),
+                    )
+                )
+        return layered_job(jobs)
+
+    def apply_job(self, job):
+        """把任务描述套用到当前图片：按层重建水印，层数不同时增删图层"""
+        layer_jobs = job_layers(job)
+        index = self.layers.index(self.active)
+        for layer in self.layers[len(layer_jobs):]:
+            self.discard_layer(layer)
+        del self.layers[len(layer_jobs):]
+        while len(self.layers) < len(layer_jobs):
+            self.layers.append(WatermarkLayer())
+        for layer, layer_job in zip(self.layers, layer_jobs):
+            self.active = self.layer = layer
+            self.apply_layer_job(layer_job)
+        self.select_layer(self.layers[min(index, len(self.layers) - 1)])
+
+    def apply_layer_job(self, job):
+        """把单层任务套用到当前图层：重建水印并换算成画布上的位置"""
+        source = job["watermark"]
+        if source == self.wm_source and not (
+            source["type"] == "text" and is_template(source["text"])
+        ):
+            # 水印没变（如会话中切换图片）：沿用已有的水印基础图，不重新读取
+            wm = self.wm_base
+        else:
+            wm = job_watermark(job)
+            if isinstance(wm, TextSpec):
+                wm = render_spec(wm, self.text_context())
+        self.show_source(source)
+        self.set_wm_base(wm)
+        self.wm_source = source
+        params = job_params(job, self.base_size, self.wm_base_size)
+        # 滑块会按自身范围与精度取值，以滑块上的值为准
+        self.scale_slider.set(params["scale"])
+        self.rotate_slider.set(params["rotation"])
+        self.opacity_slider.set(int(round(params["opacity"] * 100)))
+        self.wm_user_scale = float(self.scale_slider.get())
+        self.wm_rotation = float(self.rotate_slider.get())
+        self.wm_opacity = int(self.opacity_slider.get()) / 100.0
+        self.layer.tile = params["tile"]
+        self.place_watermark(params["center"])
+        self.redraw_watermark_on_canvas()
+
+    def export_job(self):
+        job = self.current_job()
+        if job is None:
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json", filetypes=[("水印任务", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            save_job(job, path)
+        except Exception as e:
+            messagebox.showerror("错误", f"导出任务失败：{e}")
+            return
+        self.status_var.set(f"已导出任务：{os.path.basename(path)}")
+
+    def import_job(self):
+        if self.base_path is None:
+            messagebox.showwarning("提示", "请先打开原始图片")
+            return
+        path = filedialog.askopenfilename(filetypes=[("水印任务", "*.json")])
+        if not path:
+            return
+        try:
+            self.apply_job(load_job(path))
+        except Exception as e:
+            messagebox.showerror("错误", f"导入任务失败：{e}")
+            return
+        self.status_var.set(f"已导入任务：{os.path.basename(path)}")
+
+    def fill_preset_list(self):
+        self.preset_combo["values"] = list_presets()
+
+    def on_preset_selected(self, event=None):
+        name = self.preset_var.get()
+        if self.base_path is None:
+            messagebox.showwarning("提示", "请先打开原始图片")
+            return
+        try:
+            self.apply_job(load_preset(name))
+        except Exception as e:
+            messagebox.showerror("错误", f"载入预设失败：{e}")
+            return
+        self.status_var.set(f"已套用预设：{name}")
+
+    def save_as_preset(self):
+        job = self.current_job()
+        if job is None:
+            return
+        name = simpledialog.askstring("存为预设", "预设名称：", parent=self.root)
+        if not name:
+            return
+        try:
+            save_preset(job, name)
+        except Exception as e:
+            messagebox.showerror("错误", f"保存预设失败：{e}")
+            return
+        self.preset_var.set(name.strip())
+        self.status_var.set(f"已保存预设：{name.strip()}")
+
+    # ---------- 保存最终结果（高分辨率） ----------
+    def wm_center_on_base(self):
+        """水印中心在原始图上的坐标（由 display 坐标换算）"""
+        # display 时是基于 rotated-render 的尺寸来定位的，rotate 后图片可能变大，
+        # 因此以水印中心换算到原图，再把原图尺寸的水印以中心对齐粘贴
+        if self.wm_base is None:
+            return None
+        dx, dy = self.display_offset
+        s = self.display_scale
+        render_w, render_h = self.wm_render_size()
+        center_disp_x = self.wm_x + render_w // 2
+        center_disp_y = self.wm_y + render_h // 2
+        return (
+            int(round((center_disp_x - dx) / s)),
+            int(round((center_disp_y - dy) / s)),
+        )
+
+    def place_watermark(self, center):
+        """原图坐标的水印中心 -> 画布上渲染图左上角（wm_center_on_base 的逆运算）"""
+        if self.wm_base is None or center is None:
+            return
+        dx, dy = self.display_offset
+        s = self.display_scale
+        render_w, render_h = self.wm_render_size()
+        self.wm_x = int(round(dx + center[0] * s)) - render_w // 2
+        self.wm_y = int(round(dy + center[1] * s)) - render_h // 2
+
+    def export_layers(self):
+        """各层在原图上的合成参数（wm_core.Layer 列表，从下到上）"""
+        layers = []
+        for layer in self.watermark_layers():
+            with self.using_layer(layer):
+                layers.append(
+                    Layer(
+                        self.wm_base,
+                        self.wm_center_on_base(),
+                        self.wm_user_scale,
+                        self.wm_rotation,
+                        self.wm_opacity,
+                        self.tile_spec(),
+                    )
+                )
+        return layers
+
+    def ask_save_path(self):
+        filetypes = [("PNG", "*.png"), ("JPEG", "*.jpg"), ("WebP", "*.webp")]
+        if avif_supported():
+            filetypes.append(("AVIF", "*.avif"))
+        return filedialog.asksaveasfilename(defaultextension=".png", filetypes=filetypes)
+
+    def start_base_decode(self):
+        """在后台线程解码供保存使用的原图（已解码或正在解码时不重复，上次失败则重试）"""
+        future = self._base_future
+        if future is not None and future.done() and future.exception() is not None:
+            future = None
+        if future is None:
+            self._base_future = self._decoder.submit(open_image, self.base_path)
+        return self._base_future
+
+    def save_result(self):
+        if self.base_path is None:
+            messagebox.showwarning("提示", "请先打开原始图片")
+            return
+        # 记下点击保存时各层的水印参数，解码期间继续编辑不影响本次保存
+        layers = self.export_layers()
+        if not layers:
+            # 允许用户保存无水印的原图
+            if not messagebox.askyesno("确认", "当前没有水印，是否直接保存原图？"):
+                return
+            layers = None
+        # 用户选择保存路径的同时在后台解码原图
+        future = self.start_base_decode()
+        save_path = self.ask_save_path()
+        if not save_path:
+            return
+        # 解码、渲染、合成与编码都在保存线程中进行，界面可以继续编辑下一张
+        options = {"profile": self.PROFILE_NAMES[self.profile_var.get()]}
+        self.saves.submit(
+            SaveTask(save_path, future.result, layers, options, self.timing_var.get())
+        )
+        self.poll_saves()
+
+    def poll_saves(self):
+        """在主循环中刷新后台保存的进度并处理已结束的任务"""
+        if self._save_poll_job is not None:
+            self.root.after_cancel(self._save_poll_job)
+            self._save_poll_job = None
+        for task in self.saves.pop_finished():
+            if task.cancelled:
+                self.status_var.set(f"已取消保存：{task.name}")
+            elif task.error is not None:
+                messagebox.showerror("保存失败", f"{task.name}：{task.error}")
+            elif task.recorder is not None:
+                self.status_var.set(f"已保存 {task.name}：{task.recorder.summary()}")
+            else:
+                self.status_var.set(f"已保存：{task.name}")
+        pending = self.saves.pending()
+        if not pending:
+            return
+        task = pending[0]
+        queued = f"（另有 {len(pending) - 1} 个排队）" if len(pending) > 1 else ""
+        stage = "取消中" if task.cancelled else f"{task.stage} {task.progress:.0%}"
+        self.status_var.set(f"正在保存 {task.name}：{stage}{queued}")
+        self._save_poll_job = self.root.after(self.SAVE_POLL_MS, self.poll_saves)
+
+    @contextlib.contextmanager
+    def timed(self, label):
+        """勾选“性能计时”时记录块内各阶段耗时并显示在状态栏；嵌套时并入外层"""
+        if not self.timing_var.get() or profiling_enabled():
+            yield
+            return
+        with recording() as rec:
+            yield
+        self.status_var.set(f"{label}：{rec.summary()}")
+
+    def cancel_save(self):
+        task = self.saves.cancel_current()
+        if task is None:
+            self.status_var.set("没有正在进行的保存")
+            return
+        self.poll_saves()
+
+    def on_close(self):
+        pending = self.saves.pending()
+        if pending and not messagebox.askyesno(
+            "确认退出", f"还有 {len(pending)} 个保存未完成，退出将取消它们。确定退出？"
+        ):
+            return
+        self.saves.cancel_all()
+        self.root.destroy()
@@ -0,0 +1,313 @@
+"""水印任务描述（JSON）：与分辨率无关的位置与大小，可存为预设，由批处理重放
+
+    {
+      "version": 2,
+      "watermark": {"type": "text", "text": "© YourName {date:%Y}",
+                    "font_size": 72, "font": null, "color": [255, 255, 255, 255]},
+      "anchor": "bottom-right",
+      "offset": [-0.02, -0.03],
+      "scale": 1.5,
+      "rotation": 0.0,
+      "opacity": 0.6,
+      "tile": null
+    }
+
+anchor 为九宫格位置：水印（旋转后外接矩形）的同名点对齐底图的该点，
+再按 offset（底图宽、高的比例）平移；scale 是底图短边为 1000 像素时的
+缩放倍数，其它尺寸按短边等比换算。因此在一张照片上调好的任务可直接
+用于任意分辨率的图片。图片水印写作 {"type": "image", "path": "logo.png"}，
+相对路径相对 JSON 文件所在目录。
+
+多层水印（图层栈）写作 {"version": 2, "layers": [...]}，每层是上面这样的
+单层描述（不含 version），按从下到上的顺序合成。
+"""
+import json
+import os
+
+from PIL import ImageColor
+
+from wm_core import load_watermark_image, rotated_size, scaled_size
+from wm_fonts import TextSpec, resolve_font
+
+JOB_VERSION = 2
+# scale 的参照短边（像素）
+REFERENCE_SIDE = 1000
+ANCHORS = {
+    "top-left": (0.0, 0.0),
+    "top": (0.5, 0.0),
+    "top-right": (1.0, 0.0),
+    "left": (0.0, 0.5),
+    "center": (0.5, 0.5),
+    "right": (1.0, 0.5),
+    "bottom-left": (0.0, 1.0),
+    "bottom": (0.5, 1.0),
+    "bottom-right": (1.0, 1.0),
+}
+PRESET_DIR = os.path.join(os.path.expanduser("~"), ".watermark_pro", "presets")
+
+
+# ---------- 水印描述 ----------
+def text_watermark(text, font_size=72, font=None, color=(255, 255, 255, 255)):
+    return {
+        "type": "text",
+        "text": text,
+        "font_size": font_size,
+        "font": font,
+        "color": list(color),
+    }
+
+
+def image_watermark(path):
+    return {"type": "image", "path": path}
+
+
+def parse_color(value):
+    """颜色：[r, g, b(, a)] 或 "white"、"#ff0000" 等字符串 -> RGBA 元组"""
+    if isinstance(value, str):
+        value = ImageColor.getrgb(value)
+    if not isinstance(value, (list, tuple)) or not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value
+    ):
+        raise ValueError(f"无效的颜色：{value!r}")
+    value = tuple(int(v) for v in value)
+    if len(value) == 3:
+        value += (255,)
+    if len(value) != 4:
+        raise ValueError(f"无效的颜色：{value}")
+    return value
+
+
+def job_layers(job):
+    """任务的各层（从下到上）；单层任务返回只含它自己的列表"""
+    return job["layers"] if "layers" in job else [job]
+
+
+def layered_job(layers):
+    """由各层的任务描述组成图层栈任务；只有一层时就是该层本身"""
+    if len(layers) == 1:
+        return dict(layers[0], version=JOB_VERSION)
+    return {
+        "version": JOB_VERSION,
+        "layers": [{k: v for k, v in layer.items() if k != "version"} for layer in layers],
+    }
+
+
+def job_watermarks(job):
+    """各层的水印基础图列表（见 job_watermark）"""
+    return [job_watermark(layer) for layer in job_layers(job)]
+
+
+def job_watermark(job):
+    """单层任务中的水印 -> 图片水印的基础图 (RGBA)，或文字水印的 TextSpec
+
+    文字在用到时才渲染（wm_fonts.render_spec），含模板占位符时按图片展开。
+    """
+    wm = job["watermark"]
+    if wm["type"] == "image":
+        return load_watermark_image(wm["path"])
+    return TextSpec(
+        wm["text"],
+        max(8, int(wm["font_size"])),
+        parse_color(wm["color"]),
+        resolve_font(wm["font"]),
+    )
+
+
+# ---------- 位置换算 ----------
+def nearest_anchor(center, base_size):
+    """水印中心落在底图九宫格的哪一格，就用哪一格的锚点"""
+    ax = min(2, max(0, int(3 * center[0] / base_size[0]))) / 2.0
+    ay = min(2, max(0, int(3 * center[1] / base_size[1]))) / 2.0
+    for name, value in ANCHORS.items():
+        if value == (ax, ay):
+            return name
+
+
+def _anchor_origin(anchor, base_size, render_size):
+    """offset 为 0 时水印中心在底图上的位置"""
+    ax, ay = ANCHORS[anchor]
+    return (
+        ax * base_size[0] + (0.5 - ax) * render_size[0],
+        ay * base_size[1] + (0.5 - ay) * render_size[1],
+    )
+
+
+def make_job(
+    watermark, base_size, wm_size, center, scale, rotation, opacity, tile=None, anchor=None
+):
+    """由某张底图上的像素参数生成任务描述（界面导出时使用）"""
+    anchor = anchor or nearest_anchor(center, base_size)
+    render = rotated_size(scaled_size(wm_size, scale), rotation)
+    ox, oy = _anchor_origin(anchor, base_size, render)
+    return {
+        "version": JOB_VERSION,
+        "watermark": watermark,
+        "anchor": anchor,
+        "offset": [
+            round((center[0] - ox) / base_size[0], 5),
+            round((center[1] - oy) / base_size[1], 5),
+        ],
+        "scale": round(scale * REFERENCE_SIDE / min(base_size), 5),
+        "rotation": rotation,
+        "opacity": opacity,
+        "tile": tile,
+    }
+
+
+def job_params(job, base_size, wm_size):
+    """任务在给定底图上的像素参数，即 apply_watermark 的 center/scale/... 关键字参数"""
+    scale = job["scale"] * min(base_size) / REFERENCE_SIDE
+    render = rotated_size(scaled_size(wm_size, scale), job["rotation"])
+    ox, oy = _anchor_origin(job["anchor"], base_size, render)
+    dx, dy = job["offset"]
+    return {
+        "center": (int(round(ox + dx * base_size[0])), int(round(oy + dy * base_size[1]))),
+        "scale": scale,
+        "rotation": job["rotation"],
+        "opacity": job["opacity"],
+        "tile": job["tile"],
+    }
+
+
+# ---------- 读写 ----------
+def normalize_job(job, base_dir=None):
+    """校验任务描述并补全默认值；图片水印的相对路径按 base_dir 解析"""
+    if not isinstance(job, dict):
+        raise ValueError("任务描述应为 JSON 对象")
+    version = job.get("version", JOB_VERSION)
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ValueError(f"无效的任务版本：{version!r}")
+    if version > JOB_VERSION:
+        raise ValueError(f"不支持的任务版本：{version}")
+    if "layers" in job:
+        layers = job["layers"]
+        if not isinstance(layers, list) or not layers:
+            raise ValueError("任务描述的 layers 应为非空列表")
+        return layered_job([_normalize_layer(layer, base_dir) for layer in layers])
+    return dict(_normalize_layer(job, base_dir), version=JOB_VERSION)
+
+
+def _number(value, name):
+    """JSON 中的数值字段 -> float；类型不对时给出字段名"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"任务描述的 {name} 应为数字：{value!r}")
+    return float(value)
+
+
+def _normalize_tile(tile):
+    if tile is None:
+        return None
+    if not isinstance(tile, dict):
+        raise ValueError(f"任务描述的 tile 应为对象或 null：{tile!r}")
+    angle = tile.get("angle")
+    return {
+        "spacing": max(0.0, _number(tile.get("spacing", 0.5), "tile.spacing")),
+        "stagger": _number(tile.get("stagger", 0.5), "tile.stagger"),
+        "angle": None if angle is None else _number(angle, "tile.angle"),
+    }
+
+
+def _normalize_layer(job, base_dir):
+    if not isinstance(job, dict) or not isinstance(job.get("watermark"), dict):
+        raise ValueError("任务描述缺少 watermark")
+    wm = dict(job["watermark"])
+    if wm.get("type", "text") == "image":
+        if not wm.get("path"):
+            raise ValueError("图片水印缺少 path")
+        if not isinstance(wm["path"], str):
+            raise ValueError(f"图片水印的 path 应为字符串：{wm['path']!r}")
+        path = os.path.expanduser(wm["path"])
+        if base_dir and not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        wm = image_watermark(path)
+    else:
+        if not wm.get("text"):
+            raise ValueError("文字水印缺少 text")
+        if not isinstance(wm["text"], str):
+            raise ValueError(f"文字水印的 text 应为字符串：{wm['text']!r}")
+        if wm.get("font") is not None and not isinstance(wm["font"], str):
+            raise ValueError(f"文字水印的 font 应为字体名或路径：{wm['font']!r}")
+        wm = text_watermark(
+            wm["text"],
+            int(_number(wm.get("font_size", 72), "font_size")),
+            wm.get("font"),
+            parse_color(wm.get("color", (255, 255, 255, 255))),
+        )
+    anchor = job.get("anchor", "center")
+    if anchor not in ANCHORS:
+        raise ValueError(f"未知的锚点：{anchor}（可选 {', '.join(ANCHORS)}）")
+    scale = _number(job.get("scale", 1.0), "scale")
+    if scale <= 0:
+        raise ValueError(f"任务描述的 scale 应大于 0：{scale}")
+    offset = job.get("offset", (0.0, 0.0))
+    if not isinstance(offset, (list, tuple)) or len(offset) != 2:
+        raise ValueError(f"任务描述的 offset 应为 [x, y]：{offset!r}")
+    return {
+        "watermark": wm,
+        "anchor": anchor,
+        "offset": [_number(offset[0], "offset"), _number(offset[1], "offset")],
+        "scale": scale,
+        "rotation": _number(job.get("rotation", 0.0), "rotation"),
+        "opacity": max(0.0, min(1.0, _number(job.get("opacity", 0.6), "opacity"))),
+        "tile": _normalize_tile(job.get("tile")),
+    }
+
+
+def load_job(path):
+    with open(path, encoding="utf-8") as f:
+        job = json.load(f)
+    return normalize_job(job, os.path.dirname(os.path.abspath(path)))
+
+
+def _relative_layer(layer, base_dir):
+    wm = layer["watermark"]
+    if wm["type"] != "image":
+        return layer
+    try:
+        rel = os.path.relpath(os.path.abspath(wm["path"]), base_dir)
+    except ValueError:  # Windows 上不在同一盘符
+        rel = os.pardir
+    if rel.startswith(os.pardir):
+        return layer
+    return dict(layer, watermark=image_watermark(rel))
+
+
+def save_job(job, path):
+    """写出任务 JSON；图片水印位于 JSON 所在目录之下时改存相对路径"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if "layers" in job:
+        job = dict(job, layers=[_relative_layer(layer, base_dir) for layer in job["layers"]])
+    else:
+        job = _relative_layer(job, base_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+
+
+# ---------- 预设 ----------
+def preset_path(name):
+    name = name.strip()
+    if not name or os.sep in name or "/" in name:
+        raise ValueError(f"无效的预设名：{name!r}")
+    return os.path.join(PRESET_DIR, name + ".json")
+
+
+def list_presets():
+    if not os.path.isdir(PRESET_DIR):
+        return []
+    return sorted(
+        os.path.splitext(f)[0] for f in os.listdir(PRESET_DIR) if f.endswith(".json")
+    )
+
+
+def save_preset(job, name):
+    path = preset_path(name)
+    os.makedirs(PRESET_DIR, exist_ok=True)
+    save_job(job, path)
+    return path
+
+
+def load_preset(name):
+    path = preset_path(name)
+    if not os.path.isfile(path):
+        raise ValueError(f"找不到预设：{name}")
+    return load_job(path)
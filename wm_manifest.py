@@ -0,0 +1,196 @@
+"""增量处理清单：记录每个输出对应的输入内容与水印设置，未变化的图片直接跳过
+
+清单保存在输出目录的 .watermark_manifest.json 中，每个输出一条记录：
+
+    "sub/a.jpg": {"size": 123, "mtime_ns": ..., "hash": "输入内容", "settings": "水印设置"}
+
+判断是否最新时先比较大小与修改时间（只需 stat）；不同时再计算输入文件的
+内容哈希，内容未变（例如只是被 touch 或重新拷贝）同样视为最新。水印设置
+哈希涵盖参数、水印图像素、编码选项与输出格式，任何一项变化都会重新生成。
+整个判断都不解码图片。
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+from wm_core import oriented_size
+from wm_fonts import TextSpec, format_text, is_template, text_context
+
+MANIFEST_NAME = ".watermark_manifest.json"
+MANIFEST_VERSION = 1
+# 清单最多每隔这么多秒写一次盘（结束时总会写）
+SAVE_INTERVAL = 2.0
+_CHUNK = 1 << 20
+
+
+# ---------- 哈希 ----------
+def file_hash(path):
+    """输入文件的内容哈希（blake2b，按 1 MB 分块读取）"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _watermark_digest(wm_base):
+    if isinstance(wm_base, list):  # 任务的各层水印
+        return [_watermark_digest(base) for base in wm_base]
+    if isinstance(wm_base, TextSpec):
+        font = wm_base.font
+        # 字体文件被替换时也要重新生成
+        if font and os.path.isfile(font):
+            st = os.stat(font)
+            font = [font, st.st_size, st.st_mtime_ns]
+        return ["text", wm_base.text, wm_base.size, list(wm_base.fill), font]
+    h = hashlib.blake2b(wm_base.tobytes(), digest_size=16)
+    return ["image", wm_base.mode, list(wm_base.size), h.hexdigest()]
+
+
+def settings_hash(wm_base, params, save_options=None, fmt=None):
+    """水印来源、参数与编码选项的哈希"""
+    data = {
+        "watermark": _watermark_digest(wm_base),
+        "params": params,
+        "save": save_options or {},
+        "format": fmt,
+    }
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def template_texts(wm_base):
+    """水印（或各层水印的列表）中含模板占位符的文字"""
+    bases = wm_base if isinstance(wm_base, list) else [wm_base]
+    return [b.text for b in bases if isinstance(b, TextSpec) and is_template(b.text)]
+
+
+def uses_size(templates):
+    """模板是否用到图片尺寸（需要读取文件头）"""
+    return any("{width" in t or "{height" in t for t in templates)
+
+
+def file_settings(settings, wm_base, src, index=1, size=None):
+    """单张图片的设置哈希：模板文字按该图片展开后的内容参与哈希
+
+    wm_base 可以是各层水印的列表；size 为 None 时模板中的 {width}/{height}
+    按文件头读取。
+    """
+    templates = template_texts(wm_base)
+    if not templates:
+        return settings
+    if size is None and uses_size(templates):
+        with Image.open(src) as im:
+            size = oriented_size(im)
+    context = text_context(src, index, size)
+    text = "\0".join(format_text(t, context) for t in templates)
+    return hashlib.blake2b(
+        (settings + "\0" + text).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+# ---------- 清单 ----------
+def manifest_key(dst, out_dir):
+    return os.path.relpath(dst, out_dir).replace(os.sep, "/")
+
+
+class Manifest:
+    """输出相对路径 -> 输入的大小/修改时间/内容哈希与水印设置哈希"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"清单无法读取，将重新建立：{e}", file=sys.stderr)
+
+    @classmethod
+    def for_output(cls, out_dir):
+        return cls(os.path.join(out_dir, MANIFEST_NAME))
+
+    def clear(self):
+        self.entries = {}
+        self._dirty = True
+
+    def unchanged(self, key, dst, settings, st):
+        """只用 stat 判断：大小、修改时间与设置都和记录相同且 dst 存在"""
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry.get("settings") == settings
+            and entry["size"] == st.st_size
+            and entry["mtime_ns"] == st.st_mtime_ns
+            and os.path.isfile(dst)
+        )
+
+    def up_to_date(self, key, src, dst, settings, st=None):
+        """dst 存在且由内容相同的 src、相同的设置生成；st 为 src 的 os.stat 结果（可省略）"""
+        try:
+            st = st or os.stat(src)
+        except OSError:
+            return False
+        if self.unchanged(key, dst, settings, st):
+            return True
+        entry = self.entries.get(key)
+        if (
+            entry is None
+            or entry.get("settings") != settings
+            or entry["size"] != st.st_size
+            or not os.path.isfile(dst)
+        ):
+            return False
+        # 修改时间变了：内容相同时只更新记录
+        try:
+            digest = file_hash(src)
+        except OSError:
+            return False
+        if digest != entry.get("hash"):
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns
+        self._dirty = True
+        return True
+
+    def record(self, key, src, settings, st=None):
+        """记录 src 已按 settings 生成到 key；st 为处理前取得的 os.stat 结果
+
+        处理期间 src 被改写时不记录，下次仍会重新生成。
+        """
+        current = os.stat(src)
+        if st is not None and (st.st_size, st.st_mtime_ns) != (
+            current.st_size,
+            current.st_mtime_ns,
+        ):
+            return
+        st = current
+        self.entries[key] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": file_hash(src),
+            "settings": settings,
+        }
+        self._dirty = True
+
+    def save(self, force=False):
+        if not self._dirty:
+            return
+        if not force and time.monotonic() - self._saved_at < SAVE_INTERVAL:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
@@ -0,0 +1,116 @@
+"""分阶段计时：记录渲染管线各阶段的耗时与中间图像尺寸
+
+    with recording() as rec:           # 开启记录（仅对当前线程/上下文有效）
+        img = open_image(path)         # 管线内部用 stage() 打点
+    print(rec.summary())
+
+未开启记录时 stage() 只做一次 ContextVar 查询并返回共享的空对象，
+开销可以忽略，因此打点可以常驻在热点路径中。
+"""
+import contextlib
+import contextvars
+import time
+
+_recorder = contextvars.ContextVar("wm_profile_recorder", default=None)
+
+
+class Recorder:
+    """一次操作中的各阶段记录；on_stage(entry) 在每个阶段结束时回调"""
+
+    def __init__(self, on_stage=None):
+        self.stages = []
+        self.on_stage = on_stage
+
+    def add(self, name, seconds, size=None, mode=None):
+        entry = {"stage": name, "ms": round(seconds * 1000.0, 2)}
+        if size is not None:
+            entry["size"] = list(size)
+            entry["mb"] = round(size[0] * size[1] * _mode_bytes(mode) / 1e6, 2)
+            entry["mode"] = mode
+        self.stages.append(entry)
+        if self.on_stage is not None:
+            self.on_stage(entry)
+
+    @property
+    def total_ms(self):
+        return round(sum(e["ms"] for e in self.stages), 2)
+
+    def totals(self):
+        """同名阶段合并后的耗时（毫秒），按首次出现的顺序"""
+        totals = {}
+        for e in self.stages:
+            totals[e["stage"]] = totals.get(e["stage"], 0.0) + e["ms"]
+        return totals
+
+    def summary(self, limit=6):
+        """状态栏用的一行摘要，按耗时从大到小"""
+        items = sorted(self.totals().items(), key=lambda kv: -kv[1])
+        text = " · ".join(f"{name} {ms:.0f}ms" for name, ms in items[:limit])
+        return f"{text}（合计 {self.total_ms:.0f}ms）" if text else "无记录"
+
+
+def _mode_bytes(mode):
+    return {"1": 1, "L": 1, "P": 1, "LA": 2, "RGB": 3}.get(mode, 4)
+
+
+class _Stage:
+    __slots__ = ("_recorder", "_name", "_start", "_size", "_mode")
+
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self._name = name
+        self._size = self._mode = None
+
+    def note(self, img):
+        """记下该阶段产出的图像（尺寸与模式）"""
+        self._size, self._mode = img.size, img.mode
+        return img
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._recorder.add(
+            self._name, time.perf_counter() - self._start, self._size, self._mode
+        )
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def note(self, img):
+        return img
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """打点：with stage("resize") as st: img = st.note(img.resize(...))"""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NULL_STAGE
+    return _Stage(recorder, name)
+
+
+def enabled():
+    return _recorder.get() is not None
+
+
+@contextlib.contextmanager
+def recording(on_stage=None):
+    """在 with 块内开启记录，产出 Recorder"""
+    recorder = Recorder(on_stage)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
@@ -0,0 +1,146 @@
+"""后台保存队列：解码、渲染、合成与编码都在工作线程中完成，界面只轮询状态
+
+Pillow 在缩放、旋转、合成与编码时会释放 GIL，因此用线程即可让 Tk 主循环
+保持响应，也不必把整张原图序列化到其它进程。任务按提交顺序逐个执行，
+可以在两个阶段之间取消；输出先写到临时文件，完成后才替换目标文件，
+取消或失败不会留下写了一半的图片。
+"""
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from wm_core import get_render, layers_applied, save_image
+from wm_profile import recording, stage
+
+STAGES = ("排队中", "解码原图", "渲染水印", "合成并编码", "完成")
+
+
+class SaveCancelled(Exception):
+    pass
+
+
+class SaveTask:
+    """一次保存任务
+
+    load_base() 返回原图；layers 为 wm_core.Layer 列表（从下到上，None 表示
+    不加水印），所有图层在原图上一次合成、一次编码；
+    options 为 save_image 的编码参数（profile/quality 等）；record=True 时记录
+    各阶段耗时，完成后在 recorder 中。
+    """
+
+    def __init__(self, path, load_base, layers=None, options=None, record=False):
+        self.path = path
+        self.load_base = load_base
+        self.layers = layers
+        self.options = options or {}
+        self.record = record
+        self.recorder = None
+        self.stage = STAGES[0]
+        self.error = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def progress(self):
+        """0.0 - 1.0，按已完成的阶段估算"""
+        return STAGES.index(self.stage) / (len(STAGES) - 1)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _enter(self, stage):
+        if self._cancel.is_set():
+            raise SaveCancelled()
+        self.stage = stage
+
+
+def temp_path(path):
+    """与目标同目录、同扩展名的临时文件（扩展名决定编码格式）"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+def run_save(task):
+    # 记录只在本线程内生效，不影响界面线程
+    with recording() if task.record else contextlib.nullcontext() as recorder:
+        _run_save(task)
+    task.recorder = recorder
+    return task
+
+
+def _run_save(task):
+    tmp = temp_path(task.path)
+    try:
+        task._enter(STAGES[1])
+        # 原图由界面的解码线程读取，这里只记录等待时间
+        with stage("等待原图"):
+            base = task.load_base()
+        if not task.layers:
+            task._enter(STAGES[3])
+            save_image(base, tmp, **task.options)
+        else:
+            task._enter(STAGES[2])
+            # 先放进渲染缓存，合成阶段直接取用
+            for layer in task.layers:
+                get_render(layer.wm_base, layer.scale, layer.rotation, layer.opacity)
+            task._enter(STAGES[3])
+            with layers_applied(base, task.layers) as result:
+                save_image(result, tmp, **task.options)
+        # 编码期间被取消时丢弃结果，不覆盖目标文件
+        task._enter(STAGES[4])
+        os.replace(tmp, task.path)
+    except BaseException as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if not isinstance(e, SaveCancelled):
+            task.error = e
+            raise
+
+
+class SaveQueue:
+    """单个工作线程按顺序执行 SaveTask；由界面线程提交、轮询与取消"""
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+        self.tasks = []
+
+    def submit(self, task):
+        task.future = self._pool.submit(run_save, task)
+        self.tasks.append(task)
+        return task
+
+    def pending(self):
+        """尚未结束的任务（第一个即正在执行的任务）"""
+        return [t for t in self.tasks if not t.future.done()]
+
+    def pop_finished(self):
+        """取出已结束的任务（完成、失败或取消）"""
+        finished, remaining = [], []
+        for t in self.tasks:
+            (finished if t.future.done() else remaining).append(t)
+        self.tasks = remaining
+        return finished
+
+    def cancel_current(self):
+        """取消最早提交、尚未结束的任务，返回该任务或 None"""
+        pending = self.pending()
+        if not pending:
+            return None
+        task = pending[0]
+        task.cancel()
+        task.future.cancel()
+        return task
+
+    def cancel_all(self):
+        for task in self.pending():
+            task.cancel()
+            task.future.cancel()
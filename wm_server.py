@@ -0,0 +1,427 @@
+"""本地 HTTP 水印服务：网站后台等按预设给上传的图片加水印，取回编码好的结果
+
+    python watermark.py serve --preset 署名 --preset 平铺 -j 4
+    curl --data-binary @photo.jpg "http://127.0.0.1:8800/watermark?preset=署名" -o out.jpg
+    curl -F image=@photo.jpg -F preset=署名 -F format=webp http://127.0.0.1:8800/watermark -o out.webp
+
+    GET  /health      -> ok
+    GET  /presets     -> {"presets": [...]}
+    POST /watermark   参数 preset、format、profile、quality、name（查询串或表单字段）
+
+请求体可以是原始图片（Content-Length 或 chunked 流式上传），也可以是
+multipart 表单的 image 字段。前端是单线程的 asyncio 服务器，只收发字节；
+解码、合成与编码在常驻的进程池中进行。预设只在启动时载入一次（解析字体、
+渲染文字、读取水印图），随 initializer 发给每个工作进程，各进程的渲染缓存
+跨请求保留，同样尺寸的照片直接复用缩放、旋转好的水印。
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import email.message
+import email.parser
+import email.policy
+import io
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from PIL import Image, UnidentifiedImageError
+
+from wm_batch import image_layers
+from wm_core import (
+    ENCODER_PROFILES,
+    apply_layers,
+    apply_orientation,
+    exif_orientation,
+    output_formats,
+    save_image,
+)
+from wm_job import job_watermarks, list_presets, load_job, load_preset
+
+DEFAULT_PORT = 8800
+# 未指定 format 时与输入格式一致，其它输入格式输出 PNG
+FORMAT_EXTS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "AVIF": "avif"}
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    414: "URI Too Long",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+Request = collections.namedtuple("Request", "method path query headers body keep_alive")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------- 工作进程 ----------
+# 预设名 -> (各层水印, 任务描述)，由 initializer 在每个进程中设置一次
+_presets = {}
+
+
+def _init_server_worker(presets):
+    # Ctrl+C 由主进程处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 预先注册全部格式插件，第一个请求不必再导入
+    Image.init()
+    _presets.update(presets)
+
+
+def _serve_task(preset, data, name, fmt, save_options):
+    """解码上传的图片，按预设合成并编码，返回 (输出字节, 扩展名)"""
+    wm_base, job = _presets[preset]
+    with Image.open(io.BytesIO(data)) as im:
+        im.load()
+        orientation = exif_orientation(im)
+        fmt = fmt or FORMAT_EXTS.get(im.format, "png")
+        upright = apply_orientation(im, orientation)
+        # name 由客户端给出，不是本机文件：模板只用文件名，不读取同名文件的修改时间
+        layers = image_layers(wm_base, job, name, 1, upright.size, on_disk=False)
+        # 刚解码的图片只属于本请求，直接原地合成
+        result = apply_layers(upright, layers, inplace=True)
+        out = io.BytesIO()
+        save_image(result, "result." + fmt, fp=out, **save_options)
+    return out.getvalue(), fmt
+
+
+# ---------- HTTP ----------
+async def read_line(reader, status=431, message="请求头过长"):
+    """读取一行；超过 StreamReader 的长度上限（64 KB）时按 status 回复"""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HTTPError(status, message)
+
+
+async def read_request(reader, writer, max_bytes):
+    """读取一个请求；对方已关闭连接时返回 None"""
+    line = await read_line(reader, 414, "请求行过长")
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "无效的请求行")
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        keep_alive = connection == "keep-alive"
+    else:
+        keep_alive = connection != "close"
+
+    chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+    try:
+        length = 0 if chunked else int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "无效的 Content-Length")
+    if length < 0:
+        raise HTTPError(400, "无效的 Content-Length")
+    if length > max_bytes:
+        raise HTTPError(413, f"请求体超过 {max_bytes // (1 << 20)} MB")
+    # curl 等客户端上传大文件前会等待 100 Continue
+    if headers.get("expect", "").lower() == "100-continue":
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+    if chunked:
+        body = await read_chunked(reader, max_bytes)
+    else:
+        body = await reader.readexactly(length)
+
+    url = urlsplit(target)
+    query = dict(parse_qsl(url.query))
+    return Request(method.upper(), url.path, query, headers, body, keep_alive)
+
+
+async def read_chunked(reader, max_bytes):
+    chunks, total = [], 0
+    while True:
+        line = await read_line(reader, 400, "无效的分块编码")
+        try:
+            size = int(line.split(b";")[0].strip(), 16)
+        except ValueError:
+            raise HTTPError(400, "无效的分块编码")
+        if size < 0:
+            raise HTTPError(400, "无效的分块编码")
+        if size == 0:
+            # 跳过 trailer
+            while (await read_line(reader)) not in (b"\r\n", b"\n", b""):
+                pass
+            return b"".join(chunks)
+        total += size
+        if total > max_bytes:
+            raise HTTPError(413, f"请求体超过 {max_bytes // (1 << 20)} MB")
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+def _header(value):
+    """带参数的头（Content-Type、Content-Disposition）"""
+    message = email.message.Message()
+    message["content-type"] = value
+    return message
+
+
+def parse_multipart(content_type, body):
+    """multipart/form-data -> (文字字段 dict, 图片文件名, 图片字节)"""
+    boundary = _header(content_type).get_param("boundary")
+    if not boundary:
+        raise HTTPError(400, "multipart 缺少 boundary")
+    fields, name, data = {}, None, None
+    parser = email.parser.BytesHeaderParser(policy=email.policy.HTTP)
+    # 按分隔行切开，不逐行解析，大图也只多一次拷贝
+    for part in body.split(b"--" + boundary.encode("latin-1"))[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, content = part.partition(b"\r\n\r\n")
+        if content.endswith(b"\r\n"):
+            content = content[:-2]
+        disposition = parser.parsebytes(head.lstrip(b"\r\n")).get("content-disposition", "")
+        params = _header(disposition)
+        field, filename = params.get_param("name"), params.get_param("filename")
+        if field == "image" or (filename is not None and data is None):
+            name, data = filename, content
+        elif field:
+            fields[field] = content.decode("utf-8", "replace")
+    if data is None:
+        raise HTTPError(400, "表单中缺少 image 字段")
+    return fields, name, data
+
+
+def response_bytes(status, headers, body, keep_alive):
+    headers = dict(headers)
+    headers["Content-Length"] = str(len(body))
+    headers["Connection"] = "keep-alive" if keep_alive else "close"
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    lines += [f"{key}: {value}" for key, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def json_response(status, data):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return status, {"Content-Type": "application/json; charset=utf-8"}, body
+
+
+# ---------- 服务 ----------
+class WatermarkServer:
+    """把请求分派到进程池；presets 为 预设名 -> (各层水印, 任务描述)"""
+
+    def __init__(self, pool, presets, save_options, max_bytes):
+        self.pool = pool
+        self.presets = presets
+        self.save_options = save_options
+        self.max_bytes = max_bytes
+
+    async def handle(self, reader, writer):
+        """一个连接：HTTP/1.1 长连接上可连续处理多个请求"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, writer, self.max_bytes)
+                except HTTPError as e:
+                    # 请求体可能没有读完，回复后关闭连接
+                    status, headers, body = json_response(e.status, {"error": str(e)})
+                    writer.write(response_bytes(status, headers, body, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                status, headers, body = await self.dispatch(request)
+                writer.write(response_bytes(status, headers, body, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # 客户端中途断开
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def dispatch(self, request):
+        try:
+            if request.path == "/health":
+                return 200, {"Content-Type": "text/plain"}, b"ok"
+            if request.path == "/presets":
+                return json_response(200, {"presets": sorted(self.presets)})
+            if request.path == "/watermark":
+                if request.method != "POST":
+                    raise HTTPError(405, "请用 POST 上传图片")
+                return await self.watermark(request)
+            raise HTTPError(404, f"未知的路径：{request.path}")
+        except HTTPError as e:
+            return json_response(e.status, {"error": str(e)})
+        except Exception as e:
+            print(f"处理请求失败：{e!r}", file=sys.stderr)
+            return json_response(500, {"error": str(e)})
+
+    def default_preset(self):
+        return next(iter(self.presets)) if len(self.presets) == 1 else None
+
+    async def watermark(self, request):
+        params = dict(request.query)
+        name = None
+        content_type = request.headers.get("content-type", "")
+        if content_type.lower().startswith("multipart/form-data"):
+            fields, name, data = parse_multipart(content_type, request.body)
+            for key, value in fields.items():
+                params.setdefault(key, value)
+        else:
+            data = request.body
+        if not data:
+            raise HTTPError(400, "请求体中没有图片")
+
+        preset = params.get("preset") or self.default_preset()
+        choices = "、".join(sorted(self.presets))
+        if preset is None:
+            raise HTTPError(400, f"请用 preset 参数指定预设（可选 {choices}）")
+        if preset not in self.presets:
+            raise HTTPError(400, f"未知的预设：{preset}（可选 {choices}）")
+        fmt = params.get("format")
+        if fmt is not None and fmt not in output_formats():
+            raise HTTPError(400, f"不支持的输出格式：{fmt}（可选 {', '.join(output_formats())}）")
+        options = dict(self.save_options)
+        if "profile" in params:
+            if params["profile"] not in ENCODER_PROFILES:
+                raise HTTPError(400, f"未知的编码配置：{params['profile']}")
+            options["profile"] = params["profile"]
+        if "quality" in params:
+            try:
+                options["quality"] = int(params["quality"])
+            except ValueError:
+                raise HTTPError(400, "quality 应为整数")
+        name = os.path.basename(params.get("name") or name or "upload")
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            out, fmt = await loop.run_in_executor(
+                self.pool, _serve_task, preset, data, name, fmt, options
+            )
+        except UnidentifiedImageError:
+            raise HTTPError(400, "无法识别的图片格式")
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # 无法识别或损坏的图片、编码参数错误等，属于请求本身的问题
+            raise HTTPError(400, f"无法处理图片：{e}")
+        ms = (time.perf_counter() - start) * 1000.0
+        print(f"{name}（{preset}）{len(data) / 1e6:.1f}MB -> {fmt} {ms:.0f}ms", flush=True)
+        headers = {
+            "Content-Type": CONTENT_TYPES.get(fmt, "application/octet-stream"),
+            "Server-Timing": f"watermark;dur={ms:.1f}",
+        }
+        return 200, headers, out
+
+
+# ---------- 命令行 ----------
+def load_presets(args):
+    """--job/--preset 指定的任务；都未指定时载入全部已保存的预设"""
+    jobs = {}
+    for path in args.job or []:
+        jobs[os.path.splitext(os.path.basename(path))[0]] = load_job(path)
+    names = args.preset or ([] if args.job else list_presets())
+    for name in names:
+        jobs[name] = load_preset(name)
+    # 在主进程中生成一次水印，工作进程直接使用
+    return {name: (job_watermarks(job), job) for name, job in jobs.items()}
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="watermark.py serve", description="本地 HTTP 水印服务（按预设给上传的图片加水印）"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只接受本机连接）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="端口（0 表示随机）")
+    parser.add_argument(
+        "--preset", action="append", help="提供的预设名，可重复；未指定时提供全部已保存的预设"
+    )
+    parser.add_argument(
+        "--job", action="append", help="任务 JSON，按文件名（不含扩展名）作为预设名提供，可重复"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="工作进程数（0 表示 CPU 核数）"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=list(ENCODER_PROFILES),
+        default="default",
+        help="默认编码配置（请求可用 profile 参数覆盖）",
+    )
+    parser.add_argument("--quality", type=int, help="默认 JPEG/WebP/AVIF 质量")
+    parser.add_argument(
+        "--max-mb", type=float, default=100.0, help="单个请求体的大小上限（MB）"
+    )
+    return parser
+
+
+async def serve(args, server):
+    listener = await asyncio.start_server(server.handle, args.host, args.port)
+    port = listener.sockets[0].getsockname()[1]
+    print(
+        f"水印服务：http://{args.host}:{port}（预设：{'、'.join(sorted(server.presets))}），Ctrl+C 退出",
+        flush=True,
+    )
+    # 服务管理器用 SIGTERM 停止服务时同样关闭进程池（Windows 上没有该信号处理）
+    stopped = asyncio.Event()
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    async with listener:
+        await stopped.wait()
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        presets = load_presets(args)
+    except Exception as e:
+        print(f"载入预设失败：{e}", file=sys.stderr)
+        return 1
+    if not presets:
+        print("没有可用的预设：用 --preset 或 --job 指定（界面中“存为预设”保存）", file=sys.stderr)
+        return 1
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_server_worker, initargs=(presets,)
+    )
+    # 启动时就拉起全部工作进程，第一个请求不必等待进程启动与预设传输
+    for future in [pool.submit(int) for _ in range(workers)]:
+        future.result()
+    server = WatermarkServer(
+        pool,
+        presets,
+        {"profile": args.profile, "quality": args.quality},
+        int(args.max_mb * (1 << 20)),
+    )
+    try:
+        asyncio.run(serve(args, server))
+    except KeyboardInterrupt:
+        print("正在退出…", file=sys.stderr)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
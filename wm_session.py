@@ -0,0 +1,133 @@
+"""多图会话：文件夹中的图片列表、每张图片的水印参数、显示图 LRU 缓存与后台预取
+
+显示用的缩小图按像素字节数限制总量（LRU 淘汰），即使文件夹里有上千张图片
+内存也有上限；当前图片前后几张在后台线程中预先解码，切换时直接命中缓存。
+"""
+import collections
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from wm_batch import IMAGE_EXTS
+from wm_core import open_preview
+
+
+def folder_images(folder):
+    """文件夹中（不递归）的图片，按文件名排序"""
+    names = sorted(
+        (f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS)),
+        key=str.lower,
+    )
+    return [os.path.join(folder, f) for f in names]
+
+
+def image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+def load_thumbnail(path, size):
+    """缩略图：JPEG 按 1/8 draft 解码后再缩小"""
+    img, _ = open_preview(path, size)
+    img.thumbnail(size)
+    return img
+
+
+class ImageCache:
+    """path -> loader(path) 结果的线程安全 LRU，按图片字节数限制总量
+
+    loader 在后台线程中执行；request() 返回 Future，同一路径不会重复解码。
+    """
+
+    def __init__(self, loader, max_bytes, workers=2, sizeof=image_bytes):
+        self._loader = loader
+        self._sizeof = sizeof
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()  # path -> (value, nbytes)
+        self._futures = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def get(self, path):
+        """已缓存的结果或 None（命中时移到最近使用）"""
+        with self._lock:
+            item = self._items.get(path)
+            if item is None:
+                return None
+            self._items.move_to_end(path)
+            return item[0]
+
+    def request(self, path):
+        """返回结果的 Future；已缓存时返回已完成的 Future"""
+        with self._lock:
+            item = self._items.get(path)
+            if item is not None:
+                self._items.move_to_end(path)
+                future = Future()
+                future.set_result(item[0])
+                return future
+            future = self._futures.get(path)
+            if future is None:
+                future = self._pool.submit(self._load, path)
+                self._futures[path] = future
+            return future
+
+    def prefetch(self, paths):
+        """后台预取 paths；不再需要的、尚未开始的预取任务直接取消"""
+        wanted = set(paths)
+        with self._lock:
+            for path, future in list(self._futures.items()):
+                if path not in wanted and future.cancel():
+                    del self._futures[path]
+        for path in paths:
+            self.request(path)
+
+    def _load(self, path):
+        try:
+            value = self._loader(path)
+        except BaseException:
+            with self._lock:
+                self._futures.pop(path, None)
+            raise
+        nbytes = self._sizeof(value)
+        with self._lock:
+            self._futures.pop(path, None)
+            if path not in self._items:
+                self._items[path] = (value, nbytes)
+                self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def info(self):
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._bytes}
+
+
+class Session:
+    """一组图片与各自的水印任务（wm_job 格式，与分辨率无关）"""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.index = 0
+        self.jobs = {}  # path -> job
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def current(self):
+        return self.paths[self.index]
+
+    def clamp(self, index):
+        return max(0, min(len(self.paths) - 1, index))
+
+    def neighbours(self, radius):
+        """当前图片前后 radius 张（近的在前），用于预取"""
+        order = []
+        for d in range(1, radius + 1):
+            for i in (self.index + d, self.index - d):
+                if 0 <= i < len(self.paths):
+                    order.append(self.paths[i])
+        return order
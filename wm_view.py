@@ -0,0 +1,113 @@
+"""预览视图：原图的多级缩小图（mip 金字塔）与视口瓦片缓存
+
+界面缩放或窗口大小变化时，从不小于目标尺寸的最近一级出发重采样，
+而不必每次从大图重新缩放；放大查看细节时只为画布上可见的区域生成
+固定大小的瓦片并缓存，平移只需补上新露出的瓦片，内存按字节数封顶，
+与原图大小无关。
+"""
+import collections
+
+from PIL import Image
+
+from wm_profile import stage
+
+
+class Pyramid:
+    """levels 按分辨率从高到低，每级为 (相对原图的比例, 图)，下一级是上一级的一半"""
+
+    MIN_SIDE = 64
+
+    def __init__(self, img, full_size):
+        self.full_size = full_size
+        self.full = None  # 原图（放大超过预览分辨率时才载入）
+        self.levels = []
+        with stage("金字塔") as st:
+            scale = img.width / full_size[0]
+            self.levels.append((scale, img))
+            while min(img.size) // 2 >= self.MIN_SIDE:
+                img = img.reduce(2)
+                scale /= 2.0
+                self.levels.append((scale, img))
+            st.note(self.levels[0][1])
+
+    @property
+    def max_scale(self):
+        """不借助原图能提供的最大比例"""
+        return 1.0 if self.full is not None else self.levels[0][0]
+
+    def set_full(self, img):
+        if self.levels[0][0] < 1.0:
+            self.full = img
+
+    def level_for(self, scale):
+        """不小于 scale 的最小一级；都比 scale 小（放大）时返回最大的一级"""
+        best = (1.0, self.full) if self.full is not None else self.levels[0]
+        for level in self.levels:
+            if level[0] < scale:
+                break
+            best = level
+        return best
+
+    def scaled_size(self, scale):
+        return (
+            max(1, int(self.full_size[0] * scale)),
+            max(1, int(self.full_size[1] * scale)),
+        )
+
+
+class TileCache:
+    """按 (比例, 来源级别, 瓦片坐标) 缓存缩放后的瓦片，按字节数 LRU 淘汰"""
+
+    TILE = 256
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()
+        self._bytes = 0
+
+    def clear(self):
+        self._items.clear()
+        self._bytes = 0
+
+    def _tile(self, pyramid, scale, tx, ty):
+        level_scale, level = pyramid.level_for(scale)
+        key = (scale, level_scale, tx, ty)
+        tile = self._items.get(key)
+        if tile is not None:
+            self._items.move_to_end(key)
+            return tile
+        w, h = pyramid.scaled_size(scale)
+        t = self.TILE
+        x0, y0 = tx * t, ty * t
+        x1, y1 = min(x0 + t, w), min(y0 + t, h)
+        r = level_scale / scale
+        if r >= 1.0:
+            resample = Image.LANCZOS
+        elif level_scale >= 1.0:
+            # 超过 1:1 时按像素放大，便于检查细节
+            resample = Image.NEAREST
+        else:
+            # 原图尚未载入，先用预览图放大占位
+            resample = Image.BILINEAR
+        # box 以级别图中的坐标取样，瓦片边缘会用到相邻像素，拼接处没有接缝
+        tile = level.resize(
+            (x1 - x0, y1 - y0), resample, box=(x0 * r, y0 * r, x1 * r, y1 * r)
+        )
+        nbytes = tile.width * tile.height * len(tile.getbands())
+        self._items[key] = tile
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            _, old = self._items.popitem(last=False)
+            self._bytes -= old.width * old.height * len(old.getbands())
+        return tile
+
+    def render(self, pyramid, scale, box):
+        """原图按 scale 缩放后 box 区域（缩放后的坐标）的图像，由瓦片拼成"""
+        t = self.TILE
+        mode = pyramid.levels[0][1].mode
+        out = Image.new(mode, (box[2] - box[0], box[3] - box[1]))
+        for ty in range(box[1] // t, (box[3] - 1) // t + 1):
+            for tx in range(box[0] // t, (box[2] - 1) // t + 1):
+                tile = self._tile(pyramid, scale, tx, ty)
+                out.paste(tile, (tx * t - box[0], ty * t - box[1]))
+        return out
@@ -0,0 +1,385 @@
+"""热文件夹：持续监视输入目录，新放入的图片几秒内输出加好水印的副本
+
+    python watermark.py watch 投稿目录 -o 输出目录 --job 任务.json
+    python watermark.py watch 投稿目录 -o 输出目录 --preset 署名 -j 4 -r
+    python watermark.py watch 投稿目录 -o 输出目录 --text "© YourName" --once
+
+安装了 watchdog 时用系统通知（inotify 等）唤醒扫描，否则定时轮询目录
+（只读目录项与 stat，不打开文件）。文件大小与修改时间连续 --settle 秒不变
+才认为已写完，避免读到拷贝了一半的图片。已完成的文件记在输出目录的
+清单（wm_manifest）中，重启后输入与水印设置都没变的图片不会重复处理；
+与 batch 一样，模板文字按每张图片展开后的内容参与比较，两者可以交替
+写同一个输出目录。进程池在整个运行期间保留，水印只在每个进程启动时
+准备一次。
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from wm_batch import (
+    IMAGE_EXTS,
+    add_watermark_args,
+    init_worker,
+    open_timings,
+    output_path,
+    run_task,
+    save_options_from_args,
+    watermark_from_args,
+    write_timing,
+)
+from wm_core import oriented_size
+from wm_manifest import (
+    Manifest,
+    file_settings,
+    manifest_key,
+    settings_hash,
+    template_texts,
+    uses_size,
+)
+from wm_save import temp_path
+
+
+# ---------- 目录扫描 ----------
+def scan_folder(folder, recursive=False, skip_dir=None):
+    """产出 (相对路径, stat)；跳过隐藏文件、临时文件与输出目录
+
+    顺序与 batch 展开目录时相同（按名称，先文件后子目录），模板中的 {index} 一致。
+    """
+    skip_dir = os.path.normcase(os.path.abspath(skip_dir)) if skip_dir else None
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = sorted(os.scandir(current), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    if recursive and os.path.normcase(os.path.abspath(entry.path)) != skip_dir:
+                        subdirs.append(entry.path)
+                    continue
+                if ".part." in entry.name or not entry.name.lower().endswith(IMAGE_EXTS):
+                    continue
+                st = entry.stat()
+            except OSError:  # 扫描期间被移走
+                continue
+            yield os.path.relpath(entry.path, folder), st
+        stack.extend(reversed(subdirs))
+
+
+def start_observer(folder, recursive, wake):
+    """watchdog 可用时在目录变化时 wake.set()，返回 observer；否则返回 None"""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), folder, recursive=recursive)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+# ---------- 处理 ----------
+def _init_watch_worker(*args):
+    # Ctrl+C 与 SIGTERM 由主进程处理：等待在途任务完成后再退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    init_worker(*args)
+
+
+def _watch_task(src, dst, index):
+    """先写临时文件再改名，下游不会读到写了一半的输出"""
+    tmp = temp_path(dst)
+    result = run_task(src, tmp, index)
+    if result.error is None:
+        os.replace(tmp, dst)
+    elif os.path.exists(tmp):
+        os.remove(tmp)
+    return result._replace(dst=dst)
+
+
+class HotFolder:
+    """扫描、去抖与提交；在主线程中循环执行 step()"""
+
+    def __init__(
+        self,
+        folder,
+        out_dir,
+        pool,
+        manifest,
+        settings,
+        wm_base=None,
+        recursive=False,
+        fmt=None,
+        settle=2.0,
+        max_inflight=2,
+        on_result=None,
+    ):
+        self.folder = folder
+        self.out_dir = out_dir
+        self.pool = pool
+        self.manifest = manifest
+        self.settings = settings
+        self.wm_base = wm_base
+        self._templates = template_texts(wm_base)
+        self.recursive = recursive
+        self.fmt = fmt
+        self.settle = settle
+        self.max_inflight = max_inflight
+        self.on_result = on_result
+        self.wake = threading.Event()
+        self._seen = {}  # rel -> (签名, 签名首次出现的时间)
+        self._ready = []  # 已稳定、等待提交的 rel
+        self._pending = {}  # future -> (rel, 处理前的 stat, 单张设置哈希)
+        self._failed = {}  # rel -> 失败时的签名，文件变化后才重试
+        self._indexes = {}  # rel -> 序号（模板中的 {index}），按首次扫描到的顺序
+        self._sizes = {}  # rel -> (签名, 摆正后的尺寸)，模板用到尺寸时缓存
+        self._counter = 0
+
+    def scan(self):
+        """扫描目录；返回距下一个文件稳定还需等待的秒数（没有则为 None）"""
+        now = time.monotonic()
+        queued = set(self._ready) | {pending[0] for pending in self._pending.values()}
+        seen = {}
+        wait_for = None
+        for rel, st in scan_folder(self.folder, self.recursive, self.out_dir):
+            signature = (st.st_size, st.st_mtime_ns)
+            if (
+                rel in queued
+                or self._failed.get(rel) == signature
+                or self.manifest.unchanged(
+                    self._key(rel), self._dst(rel), self._file_settings(rel, st), st
+                )
+            ):
+                continue
+            prev = self._seen.get(rel)
+            since = prev[1] if prev and prev[0] == signature else now
+            seen[rel] = (signature, since)
+            remaining = self.settle - (now - since)
+            if remaining <= 0:
+                self._ready.append(rel)
+                del seen[rel]
+            elif wait_for is None or remaining < wait_for:
+                wait_for = remaining
+        self._seen = seen
+        return wait_for
+
+    def _dst(self, rel):
+        return output_path(rel, self.out_dir, self.fmt)
+
+    def _key(self, rel):
+        return manifest_key(self._dst(rel), self.out_dir)
+
+    def _index(self, rel):
+        if rel not in self._indexes:
+            self._counter += 1
+            self._indexes[rel] = self._counter
+        return self._indexes[rel]
+
+    def _file_settings(self, rel, st):
+        """单张图片的设置哈希（wm_manifest.file_settings），与 batch 写入清单的一致
+
+        文件头读不出尺寸（还没写完）时返回 None，视为需要处理。
+        """
+        if not self._templates:
+            return self.settings
+        index = self._index(rel)
+        src = os.path.join(self.folder, rel)
+        size = None
+        if uses_size(self._templates):
+            # 每轮扫描都要比较，尺寸按文件签名缓存，不重复读文件头
+            signature = (st.st_size, st.st_mtime_ns)
+            cached = self._sizes.get(rel)
+            if cached is not None and cached[0] == signature:
+                size = cached[1]
+            else:
+                try:
+                    with Image.open(src) as im:
+                        size = oriented_size(im)
+                except OSError:
+                    return None
+                self._sizes[rel] = (signature, size)
+        try:
+            return file_settings(self.settings, self.wm_base, src, index, size)
+        except OSError:
+            return None
+
+    def submit_ready(self):
+        while self._ready and len(self._pending) < self.max_inflight:
+            rel = self._ready.pop(0)
+            src, dst = os.path.join(self.folder, rel), self._dst(rel)
+            try:
+                st = os.stat(src)
+            except OSError:
+                continue
+            file_key = self._file_settings(rel, st) or self.settings
+            # 修改时间变了但内容相同（重新拷贝、touch）时不必重做
+            if self.manifest.up_to_date(self._key(rel), src, dst, file_key, st):
+                continue
+            future = self.pool.submit(_watch_task, src, dst, self._index(rel))
+            future.add_done_callback(lambda f: self.wake.set())
+            self._pending[future] = (rel, st, file_key)
+
+    def collect(self):
+        for future in [f for f in self._pending if f.done()]:
+            rel, st, file_key = self._pending.pop(future)
+            if future.cancelled():  # 退出时尚未开始的任务
+                continue
+            result = future.result()
+            if result.error:
+                self._failed[rel] = (st.st_size, st.st_mtime_ns)
+            else:
+                self._failed.pop(rel, None)
+                try:
+                    self.manifest.record(self._key(rel), result.src, file_key, st)
+                except OSError:  # 处理完后输入已被移走
+                    pass
+            if self.on_result is not None:
+                self.on_result(result)
+        self.manifest.save()
+
+    @property
+    def idle(self):
+        return not (self._seen or self._ready or self._pending)
+
+    def step(self, interval):
+        """一轮：收集结果、扫描、提交，然后等待到下一轮（或被唤醒）"""
+        self.collect()
+        wait_for = self.scan()
+        self.submit_ready()
+        timeout = interval if wait_for is None else min(interval, wait_for)
+        self.wake.wait(max(0.05, timeout))
+        self.wake.clear()
+
+
+# ---------- 命令行 ----------
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="watermark.py watch", description="监视文件夹，自动给新放入的图片添加水印"
+    )
+    parser.add_argument("folder", help="监视的输入目录")
+    parser.add_argument("-o", "--output", required=True, help="输出目录")
+    parser.add_argument("-r", "--recursive", action="store_true", help="同时监视子目录")
+    add_watermark_args(parser)
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="并行进程数（0 表示 CPU 核数）"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=2.0, help="文件大小与修改时间保持不变多少秒后才处理"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="轮询间隔（秒）；使用 watchdog 时为兜底间隔"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="忽略输出目录中的清单，现有图片全部重新生成"
+    )
+    parser.add_argument("--once", action="store_true", help="处理完目录中现有的图片后退出")
+    parser.add_argument(
+        "--timings", metavar="FILE", help="把每张图片各阶段的耗时写入 JSON Lines 文件（- 表示标准输出）"
+    )
+    return parser
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if (args.x is None) != (args.y is None):
+        print("错误：--x 与 --y 需同时指定", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.folder):
+        print(f"目录不存在：{args.folder}", file=sys.stderr)
+        return 1
+    if os.path.abspath(args.folder) == os.path.abspath(args.output):
+        print("错误：输出目录不能与监视目录相同", file=sys.stderr)
+        return 2
+    try:
+        wm_base, params = watermark_from_args(args)
+    except Exception as e:
+        print(f"生成水印失败：{e}", file=sys.stderr)
+        return 1
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    timings = open_timings(args.timings)
+    save_options = save_options_from_args(args)
+    manifest = Manifest.for_output(args.output)
+    if args.force:
+        manifest.clear()
+    counts = {"done": 0, "failed": 0}
+    # systemd 等服务管理器用 SIGTERM 停止进程：与 Ctrl+C 一样收尾，保存清单并关闭进程池
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    def on_result(r):
+        if timings is not None:
+            write_timing(timings, r)
+        if r.error:
+            counts["failed"] += 1
+            print(f"失败 {r.src}：{r.error}", file=sys.stderr)
+        else:
+            counts["done"] += 1
+            print(f"{r.src} -> {r.dst}（{r.seconds:.1f}s）", flush=True)
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_watch_worker,
+        initargs=(wm_base, params, save_options, timings is not None),
+    )
+    folder = HotFolder(
+        args.folder,
+        args.output,
+        pool,
+        manifest,
+        settings_hash(wm_base, params, save_options, args.format),
+        wm_base=wm_base,
+        recursive=args.recursive,
+        fmt=args.format,
+        # --once 只处理已有文件，不必等待它们“写完”
+        settle=0.0 if args.once else args.settle,
+        max_inflight=workers * 2,
+        on_result=on_result,
+    )
+    observer = None if args.once else start_observer(args.folder, args.recursive, folder.wake)
+    if not args.once:
+        mode = "watchdog" if observer is not None else f"轮询（每 {args.interval:g}s）"
+        print(f"正在监视 {args.folder}（{mode}），Ctrl+C 退出", flush=True)
+    try:
+        while True:
+            folder.step(args.interval)
+            if args.once and folder.idle:
+                folder.collect()
+                break
+    except KeyboardInterrupt:
+        print("正在退出…", file=sys.stderr)
+    finally:
+        if observer is not None:
+            observer.stop()
+        pool.shutdown(wait=True, cancel_futures=True)
+        folder.collect()
+        manifest.save(force=True)
+        if timings not in (None, sys.stdout):
+            timings.close()
+    print(f"完成 {counts['done']}，失败 {counts['failed']}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())